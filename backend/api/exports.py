@@ -0,0 +1,90 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+# строк списка покупок в одном куске потокового ответа
+CHUNK_SIZE = 500
+
+
+class PDFRenderer(BaseRenderer):
+    '''Форматы выгрузки списка покупок для согласования по Accept
+    и ?format=. Содержимое строит DownloadShoppingCartView,
+    ошибки отдаются в JSON.
+    '''
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class PlainTextRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+def format_line(row):
+    return f'{row["name"]}, {row["measurement_unit"]}: {row["total"]}'
+
+
+def chunked(rows, build):
+    '''Склеивает результаты build(row) в куски по CHUNK_SIZE строк,
+    чтобы не отдавать ответ по одной строке.
+    '''
+    chunk = []
+    for row in rows:
+        chunk.append(build(row))
+        if len(chunk) == CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def stream_text(rows):
+    yield from chunked(rows, lambda row: format_line(row) + '\n')
+
+
+class Echo:
+    '''Файл для csv.writer, возвращающий записанную строку.'''
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    yield from chunked(rows, lambda row: writer.writerow((
+        row['name'], row['measurement_unit'], row['total']
+    )))
+
+
+def stream_json(rows):
+    '''Массив в формате GET /api/recipes/shopping_list/.'''
+
+    chunks = chunked(rows, lambda row: ',' + json.dumps({
+        'name': row['name'],
+        'measurement_unit': row['measurement_unit'],
+        'amount': row['total'],
+    }, ensure_ascii=False))
+    yield '['
+    first = next(chunks, None)
+    if first is not None:
+        # у первой строки нет разделителя
+        yield first[1:]
+        yield from chunks
+    yield ']'
+
+
+# формат -> (функция потоковой выгрузки, отдавать ли файлом)
+STREAMS = {
+    PlainTextRenderer.format: (stream_text, True),
+    CSVRenderer.format: (stream_csv, True),
+    JSONRenderer.format: (stream_json, False),
+}
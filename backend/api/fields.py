@@ -0,0 +1,153 @@
+import binascii
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils.translation import gettext_lazy as _
+from rest_framework.fields import FileField, ReadOnlyField
+
+from drf_extra_fields.fields import Base64FieldMixin
+from PIL import Image
+
+from recipes.images import variant_names
+
+BASE64 = re.compile(r'[A-Za-z0-9+/]*={0,2}')
+# число символов base64, декодируемых за раз, кратно 4
+BASE64_CHUNK_SIZE = 64 * 1024
+
+
+def decode_base64(data, start=0):
+    '''Декодирует base64 из data начиная с позиции start частями
+    во временный файл: в памяти не больше IMAGE_UPLOAD_SPOOL_SIZE байт
+    картинки, остальное - на диске.
+    '''
+    if not BASE64.fullmatch(data, start):
+        # переводы строк и пробелы внутри base64
+        data, start = ''.join(data[start:].split()), 0
+        if not BASE64.fullmatch(data):
+            raise ValueError('Некорректный base64.')
+    if (len(data) - start) % 4:
+        raise binascii.Error('Incorrect padding')
+    file = tempfile.SpooledTemporaryFile(
+        max_size=settings.IMAGE_UPLOAD_SPOOL_SIZE
+    )
+    for position in range(start, len(data), BASE64_CHUNK_SIZE):
+        file.write(binascii.a2b_base64(
+            data[position:position + BASE64_CHUNK_SIZE]
+        ))
+    file.seek(0)
+    return file
+
+
+def media_url(name, request=None):
+    '''URL файла из хранилища, абсолютный при наличии request.'''
+
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
+class Base64UploadField(Base64FieldMixin, FileField):
+    '''Картинка в base64, сохраняемая как есть.
+
+    Размер проверяется по длине строки до декодирования, base64
+    декодируется частями во временный файл (decode_base64), формат
+    и размеры картинки - по заголовку без полного декодирования.
+    Перекодирование выполняет process_images (recipes.jobs).
+    '''
+
+    ALLOWED_TYPES = (
+        'jpg',
+        'png',
+        'gif',
+        'webp',
+    )
+    INVALID_FILE_MESSAGE = _('Please upload a valid image.')
+    INVALID_TYPE_MESSAGE = _("The type of the image couldn't be determined.")
+
+    def get_file_name(self, decoded_file):
+        # путь относительно upload_to поля модели: recipes/uploads/
+        return f'uploads/{super().get_file_name(decoded_file)}'
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+
+        # заголовок data:...;base64, пропускается без копирования строки
+        start = base64_data.find(';base64,')
+        start = start + len(';base64,') if start >= 0 else 0
+        size = (len(base64_data) - start) // 4 * 3
+        if size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise ValidationError(
+                'Размер картинки превышает {} МБ.'.format(
+                    settings.IMAGE_UPLOAD_MAX_SIZE // (1024 * 1024)
+                )
+            )
+        try:
+            decoded_file = decode_base64(base64_data, start)
+        except (ValueError, binascii.Error):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+
+        file_extension = self.get_file_extension(decoded_file)
+        if file_extension not in self.ALLOWED_TYPES:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        decoded_file.seek(0)
+        name = f'{self.get_file_name(decoded_file)}.{file_extension}'
+        return super(Base64FieldMixin, self).to_internal_value(
+            File(decoded_file, name=name)
+        )
+
+    def get_file_extension(self, decoded_file):
+        try:
+            # Image.open читает только заголовок
+            image = Image.open(decoded_file)
+        except (OSError, Image.DecompressionBombError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        width, height = image.size
+        if (
+            max(width, height) > settings.IMAGE_MAX_DIMENSION
+            or width * height > settings.IMAGE_MAX_PIXELS
+        ):
+            raise ValidationError(
+                f'Размер картинки {width}x{height} превышает допустимый.'
+            )
+        extension = image.format.lower()
+        return 'jpg' if extension == 'jpeg' else extension
+
+
+class ImageVariantsField(ReadOnlyField):
+    '''Ссылки на варианты картинки рецепта {формат: {ширина: url}},
+    None - пока картинка не обработана (recipes.images).
+    '''
+
+    def to_representation(self, value):
+        names = variant_names(value.name)
+        if names is None:
+            return None
+        request = self.context.get('request')
+        return {
+            format: {
+                str(width): media_url(name, request)
+                for width, name in widths.items()
+            }
+            for format, widths in names.items()
+        }
+
+
+class ThumbnailField(ReadOnlyField):
+    '''URL самого узкого JPEG-варианта картинки,
+    до обработки - исходной картинки.
+    '''
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        names = variant_names(value.name)
+        name = value.name if names is None else next(iter(
+            names['jpeg'].values()
+        ))
+        return media_url(name, self.context.get('request'))
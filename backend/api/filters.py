@@ -1,30 +1,48 @@
 from django_filters import rest_framework
 
-from recipes.models import Ingredient, Recipe
+from recipes import membership, popularity, search
+from recipes.models import Ingredient, Recipe, Tag
 
 
 class RecipeFilter(rest_framework.FilterSet):
     '''Фильтр по рецептам'''
 
-    tags = rest_framework.filters.AllValuesMultipleFilter(
-        field_name='tags__slug'
+    tags = rest_framework.filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+    )
+    # объявлен раньше ordering: ?ordering= заменяет сортировку по релевантности
+    search = rest_framework.filters.CharFilter(method='filter_search')
+    ordering = rest_framework.filters.ChoiceFilter(
+        choices=(('popular', 'по популярности'),),
+        method='filter_ordering',
     )
 
     class Meta:
         fields = ('author',)
         model = Recipe
 
+    def filter_search(self, queryset, name, value):
+        return search.search(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        # индекс recipe_popularity_idx
+        return queryset.order_by(*popularity.ORDERING)
+
     def filter_queryset(self, queryset):
         queryset = super().filter_queryset(queryset)
+        recipe_ids = membership.for_request(self.request)
         if self.request.query_params.get('is_favorited') in [
             '1', 'true', 'True'
         ]:
-            queryset = queryset.filter(recipes_fav__user=self.request.user)
+            queryset = queryset.filter(
+                id__in=recipe_ids[membership.FAVORITES]
+            )
         if self.request.query_params.get('is_in_shopping_cart') in [
             '1', 'true', 'True'
         ]:
-
-            queryset = queryset.filter(recipes_shop__user=self.request.user)
+            queryset = queryset.filter(id__in=recipe_ids[membership.CART])
         return queryset
 
 
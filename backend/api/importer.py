@@ -0,0 +1,288 @@
+import json
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from rest_framework import serializers
+
+from .serializers import RecipeWriteSerializer
+from recipes import feed, jobs, search
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag, TagRecipe
+from recipes.versions import RECIPES, bump_version
+from users.models import CustomUser
+
+
+class RecipeImportSerializer(RecipeWriteSerializer):
+    '''Проверка строки импорта по правилам RecipeWriteSerializer,
+    но без обращения к БД: теги, ингредиенты, авторы и повторы рецептов
+    проверяются сразу для всей пачки в RecipeImporter.
+
+    Теги задаются id или slug, image - путем к файлу относительно
+    каталога с картинками, author - username (необязательно).
+    '''
+
+    tags = serializers.ListField()
+    image = serializers.CharField()
+    author = serializers.CharField(required=False)
+
+    def validate_tags(self, data):
+        data = super().validate_tags(data)
+        for tag in data:
+            if isinstance(tag, bool) or not isinstance(tag, (int, str)):
+                raise serializers.ValidationError(
+                    'Теги задаются id или slug.'
+                )
+        return data
+
+    def validate_ingredients(self, data):
+        return self.merge_ingredients(data)
+
+    def validate(self, data):
+        return self.check_required_fields(data)
+
+
+class RecipeImporter:
+    '''Потоковый импорт рецептов из NDJSON (один рецепт в строке).
+
+    Строки читаются и проверяются пачками по batch_size, каждая пачка
+    записывается bulk_create в отдельной транзакции. Ошибочные строки
+    передаются в report(номер строки, ошибки) и не мешают остальным.
+    После записи пачки вызывается on_batch(номер последней строки):
+    повторный запуск с start_line продолжает импорт с места остановки.
+    '''
+
+    def __init__(self, image_dir=None, author=None, batch_size=None,
+                 report=None, on_batch=None):
+        self.image_dir = os.path.realpath(
+            image_dir or settings.RECIPE_IMPORT_IMAGE_DIR
+        )
+        self.author = author
+        self.batch_size = batch_size or settings.RECIPE_IMPORT_BATCH_SIZE
+        self.report = report or (lambda line, errors: None)
+        self.on_batch = on_batch or (lambda line: None)
+        self.serializer = RecipeImportSerializer()
+        # исходный путь картинки -> имя файла в хранилище
+        self.images = {}
+        self.created = 0
+        self.failed = 0
+
+    def run(self, lines, start_line=0):
+        '''Импортирует строки lines, пропуская первые start_line.
+
+        Возвращает словарь с числом созданных рецептов, ошибочных строк
+        и номером последней обработанной строки.
+        '''
+        last_line = start_line
+        batch = []
+        for number, line in enumerate(lines, 1):
+            if number <= start_line:
+                continue
+            batch.append((number, line))
+            if len(batch) == self.batch_size:
+                last_line = self.import_batch(batch)
+                batch = []
+        if batch:
+            last_line = self.import_batch(batch)
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'last_line': last_line,
+        }
+
+    def fail(self, line, errors):
+        self.failed += 1
+        self.batch_errors.append((line, errors))
+
+    def import_batch(self, batch):
+        self.batch_errors = []
+        rows = self.resolve(self.parse(batch))
+        rows = self.store_images(rows)
+        if rows:
+            self.write(rows)
+        for line, errors in sorted(self.batch_errors, key=lambda e: e[0]):
+            self.report(line, errors)
+        last_line = batch[-1][0]
+        self.on_batch(last_line)
+        return last_line
+
+    def parse(self, batch):
+        '''JSON и проверки отдельных полей, без запросов к БД.'''
+
+        rows = []
+        for line, raw in batch:
+            if not raw.strip():
+                continue
+            try:
+                data = json.loads(raw)
+            except ValueError as error:
+                self.fail(line, {'non_field_errors': [
+                    f'Некорректный JSON: {error}'
+                ]})
+                continue
+            if not isinstance(data, dict):
+                self.fail(line, {'non_field_errors': [
+                    'Строка должна содержать JSON-объект.'
+                ]})
+                continue
+            try:
+                rows.append((line, self.serializer.run_validation(data)))
+            except serializers.ValidationError as error:
+                self.fail(line, error.detail)
+        return rows
+
+    def resolve(self, rows):
+        '''Теги, ингредиенты, авторы и повторы рецептов
+        проверяются для всей пачки несколькими запросами.
+        '''
+        tag_keys = set()
+        ingredient_ids = set()
+        usernames = set()
+        for _, data in rows:
+            tag_keys.update(data['tags'])
+            ingredient_ids.update(data['ingredients'])
+            if 'author' in data:
+                usernames.add(data['author'])
+
+        tags = {}
+        for id, slug in Tag.objects.filter(
+            Q(id__in=[key for key in tag_keys if isinstance(key, int)])
+            | Q(slug__in=[key for key in tag_keys if isinstance(key, str)])
+        ).values_list('id', 'slug'):
+            tags[id] = tags[slug] = id
+        ingredients = set(Ingredient.objects.filter(
+            id__in=ingredient_ids
+        ).values_list('id', flat=True))
+        authors = dict(CustomUser.objects.filter(
+            username__in=usernames
+        ).values_list('username', 'id'))
+        default_author = self.author.id if self.author else None
+        existing = set(Recipe.objects.filter(
+            author_id__in=set(authors.values()) | {default_author},
+            name__in={data['name'] for _, data in rows},
+        ).values_list('author_id', 'name', 'text'))
+
+        resolved = []
+        for line, data in rows:
+            author_id = authors.get(data.get('author'), default_author)
+            errors = self.lookup_errors(data, author_id, authors, tags,
+                                        ingredients)
+            key = (author_id, data['name'], data['text'])
+            if key in existing:
+                errors[data['name']] = [
+                    'Рецепт с таким название уже существует!'
+                ]
+            if errors:
+                self.fail(line, errors)
+                continue
+            existing.add(key)
+            data['author_id'] = author_id
+            data['tag_ids'] = {tags[tag] for tag in data['tags']}
+            resolved.append((line, data))
+        return resolved
+
+    def lookup_errors(self, data, author_id, authors, tags, ingredients):
+        errors = {}
+        if 'author' in data and data['author'] not in authors:
+            errors['author'] = [f'Пользователь не найден: {data["author"]}']
+        elif author_id is None:
+            errors['author'] = ['Поле отсутствует!']
+        unknown = [str(tag) for tag in data['tags'] if tag not in tags]
+        if unknown:
+            errors['tags'] = ['Теги не найдены: {}'.format(', '.join(unknown))]
+        unknown = [
+            str(id) for id in data['ingredients'] if id not in ingredients
+        ]
+        if unknown:
+            errors['ingredients'] = [
+                'Ингредиенты не найдены: {}'.format(', '.join(unknown))
+            ]
+        return errors
+
+    def image_path(self, image):
+        path = os.path.realpath(os.path.join(self.image_dir, image))
+        if path.startswith(self.image_dir + os.sep) and os.path.isfile(path):
+            return path
+        return None
+
+    def store_images(self, rows):
+        '''Копирует картинки в хранилище, каждый файл - один раз за импорт.'''
+
+        stored = []
+        for line, data in rows:
+            path = self.image_path(data['image'])
+            if path is None:
+                self.fail(line, {'image': [
+                    f'Файл не найден: {data["image"]}'
+                ]})
+                continue
+            if path not in self.images:
+                try:
+                    with open(path, 'rb') as image:
+                        self.images[path] = default_storage.save(
+                            f'recipes/{os.path.basename(path)}', File(image)
+                        )
+                except OSError as error:
+                    self.fail(line, {'image': [str(error)]})
+                    continue
+            data['image'] = self.images[path]
+            stored.append((line, data))
+        return stored
+
+    def write(self, rows):
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author_id=data['author_id'],
+                    name=data['name'],
+                    text=data['text'],
+                    cooking_time=data['cooking_time'],
+                    image=data['image'],
+                )
+                for _, data in rows
+            )
+            if recipes[0].pk is None:
+                # БД не возвращает id из bulk_create (SQLite)
+                self.fetch_ids(recipes)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe_id=recipe.pk, ingredient_id=id, amount=amount
+                )
+                for recipe, (_, data) in zip(recipes, rows)
+                for id, amount in data['ingredients'].items()
+            )
+            TagRecipe.objects.bulk_create(
+                TagRecipe(recipe_id=recipe.pk, tag_id=id)
+                for recipe, (_, data) in zip(recipes, rows)
+                for id in data['tag_ids']
+            )
+            jobs.enqueue(recipes)
+            feed.publish(recipes)
+            search.index(recipe.pk for recipe in recipes)
+            # bulk_create не отправляет сигналы, счетчики обновляются здесь
+            authors = defaultdict(int)
+            for recipe in recipes:
+                authors[recipe.author_id] += 1
+            by_count = defaultdict(list)
+            for author_id, count in authors.items():
+                by_count[count].append(author_id)
+            for count, author_ids in by_count.items():
+                CustomUser.objects.filter(pk__in=author_ids).update(
+                    recipes_count=F('recipes_count') + count
+                )
+        bump_version(RECIPES)
+        self.created += len(recipes)
+
+    def fetch_ids(self, recipes):
+        ids = {
+            (author_id, name, text): id
+            for id, author_id, name, text in Recipe.objects.filter(
+                author_id__in={recipe.author_id for recipe in recipes},
+                name__in={recipe.name for recipe in recipes},
+            ).values_list('id', 'author_id', 'name', 'text')
+        }
+        for recipe in recipes:
+            recipe.pk = ids[(recipe.author_id, recipe.name, recipe.text)]
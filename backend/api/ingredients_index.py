@@ -0,0 +1,81 @@
+import heapq
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS, get_version
+
+
+def normalize(name):
+    '''Приведение названия к виду для поиска: регистр и ё/е.'''
+
+    return name.strip().lower().replace('ё', 'е')
+
+
+class IngredientIndex:
+    '''Префиксный индекс по названиям ингредиентов в памяти процесса.
+
+    Перестраивается лениво при изменении версии каталога INGREDIENTS
+    (сигналы на сохранение/удаление Ingredient, загрузка upload_data),
+    которая хранится в БД и общая для всех процессов.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        # (ключи, ингредиенты) заменяются одним присваиванием, чтобы
+        # search() в другом потоке не взял ключи от новой сборки,
+        # а ингредиенты от старой
+        self.index = ([], [])
+
+    def build(self):
+        rows = sorted(
+            (normalize(name), id, name, measurement_unit)
+            for id, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        keys = [row[0] for row in rows]
+        items = [
+            {'id': id, 'name': name, 'measurement_unit': measurement_unit}
+            for _, id, name, measurement_unit in rows
+        ]
+        self.index = (keys, items)
+
+    def refresh(self, version=None):
+        if version is None:
+            version = get_version(INGREDIENTS)
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            self.build()
+            self.version = version
+
+    def search(self, prefix, limit=None, version=None):
+        '''Ингредиенты, название которых начинается с prefix.
+
+        Сначала точное совпадение, затем более короткие названия,
+        при равной длине - по алфавиту. version - уже прочитанная
+        версия каталога INGREDIENTS.
+        '''
+        self.refresh(version)
+        keys, items = self.index
+        prefix = normalize(prefix)
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + '\uffff', lo=start)
+        matches = range(start, end)
+
+        def order(position):
+            key = keys[position]
+            return (key != prefix, len(key), key, items[position]['id'])
+
+        if limit is not None and limit < len(matches):
+            positions = heapq.nsmallest(limit, matches, key=order)
+        else:
+            positions = sorted(matches, key=order)
+        return [items[position] for position in positions]
+
+
+ingredient_index = IngredientIndex()
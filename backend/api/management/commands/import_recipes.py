@@ -0,0 +1,101 @@
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import RecipeImporter
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Импорт рецептов из NDJSON-файла (один рецепт в строке)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Путь к NDJSON-файлу, "-" - стандартный ввод'
+        )
+        parser.add_argument(
+            '--images',
+            help='Каталог с картинками (по умолчанию '
+                 'settings.RECIPE_IMPORT_IMAGE_DIR)'
+        )
+        parser.add_argument(
+            '--author',
+            help='username автора для строк без поля author'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Число строк в одной транзакции'
+        )
+        parser.add_argument(
+            '--errors',
+            help='Файл для отчета об ошибках (NDJSON), по умолчанию stderr'
+        )
+        parser.add_argument(
+            '--state',
+            help='Файл с номером последней обработанной строки: '
+                 'при повторном запуске импорт продолжается с нее'
+        )
+
+    def handle(self, *args, **options):
+        author = None
+        if options['author']:
+            author = CustomUser.objects.filter(
+                username=options['author']
+            ).first()
+            if author is None:
+                raise CommandError(
+                    f'Пользователь не найден: {options["author"]}'
+                )
+
+        start_line = 0
+        state = options['state']
+        if state and os.path.exists(state):
+            with open(state, encoding='utf-8') as sf:
+                start_line = int(sf.read().strip() or 0)
+
+        errors = sys.stderr
+        if options['errors']:
+            errors = open(options['errors'], 'a', encoding='utf-8')
+
+        def report(line, detail):
+            errors.write(json.dumps(
+                {'line': line, 'errors': detail}, ensure_ascii=False
+            ) + '\n')
+
+        def save_state(line):
+            if state:
+                errors.flush()
+                with open(state, 'w', encoding='utf-8') as sf:
+                    sf.write(str(line))
+
+        importer = RecipeImporter(
+            image_dir=options['images'],
+            author=author,
+            batch_size=options['batch_size'],
+            report=report,
+            on_batch=save_state,
+        )
+        started = time.monotonic()
+        try:
+            if options['path'] == '-':
+                result = importer.run(sys.stdin, start_line)
+            else:
+                with open(options['path'], encoding='utf-8') as nf:
+                    result = importer.run(nf, start_line)
+        finally:
+            if errors is not sys.stderr:
+                errors.close()
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(
+            f'Строк обработано до {result["last_line"]}, '
+            f'создано рецептов: {result["created"]}, '
+            f'ошибок: {result["failed"]}, '
+            f'{result["created"] / max(elapsed, 1e-6):.0f} рецептов/с'
+        )
+        return 'Импорт рецептов завершен'
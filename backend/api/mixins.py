@@ -0,0 +1,83 @@
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from recipes.versions import get_version
+
+
+class CatalogCacheMixin:
+    '''HTTP-кэширование справочников (ETag и Cache-Control).
+
+    ETag строится из версий каталогов catalog_versions и URL запроса,
+    поэтому If-None-Match проверяется до построения queryset
+    и сериализатора (версии запоминаются в процессе, см.
+    recipes.versions.get_catalog_version).
+    '''
+
+    catalog_versions = ()
+
+    def get_catalog_versions(self):
+        '''Версии catalog_versions, читаются один раз за запрос.'''
+
+        if not hasattr(self, '_catalog_versions'):
+            self._catalog_versions = {
+                name: get_version(name) for name in self.catalog_versions
+            }
+        return self._catalog_versions
+
+    def get_etag(self, request):
+        versions = ':'.join(
+            str(version) for version in self.get_catalog_versions().values()
+        )
+        digest = hashlib.md5(
+            f'{versions}:{request.get_full_path()}'.encode('utf-8')
+        ).hexdigest()
+        return f'"{digest}"'
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        etag = self.get_etag(request)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+        if etag in (tag.strip() for tag in if_none_match.split(',')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE
+        )
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Размер запроса превышает допустимый.'
+    default_code = 'payload_too_large'
+
+
+class BodySizeLimitMixin:
+    '''Отклоняет запросы с телом больше get_max_body_size() байт
+    по заголовку Content-Length, до чтения и разбора тела.
+    '''
+
+    def get_max_body_size(self):
+        return settings.RECIPE_MAX_BODY_SIZE
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        length = request.META.get('CONTENT_LENGTH') or ''
+        if length.isdigit() and int(length) > self.get_max_body_size():
+            raise PayloadTooLarge()
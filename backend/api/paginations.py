@@ -1,8 +1,140 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+from recipes.versions import RECIPES, get_version
+
+MAX_PAGE_SIZE = 100
+
+EXACT = 'exact'
+CACHED = 'cached'
+ESTIMATED = 'estimated'
+
+
+class CountingPaginator(Paginator):
+    '''Paginator с выбором способа подсчета count.
+
+    Способ передается в mode (по умолчанию settings.PAGINATION_COUNT_MODE),
+    фактически использованный сохраняется в count_mode.
+    '''
+
+    count_mode = EXACT
+
+    def __init__(self, *args, mode=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mode = mode or settings.PAGINATION_COUNT_MODE
+
+    def get_count_sql(self):
+        queryset = self.object_list.order_by()
+        return queryset.db, queryset.query.get_compiler(
+            queryset.db
+        ).as_sql()
+
+    def exact_count(self):
+        self.count_mode = EXACT
+        return self.object_list.count()
+
+    def cached_count(self):
+        _, (sql, params) = self.get_count_sql()
+        signature = hashlib.md5(
+            f'{sql}{params}'.encode('utf-8')
+        ).hexdigest()
+        key = f'count:{get_version(RECIPES)}:{signature}'
+        count = cache.get(key)
+        if count is None:
+            count = self.exact_count()
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        self.count_mode = CACHED
+        return count
+
+    def estimated_count(self):
+        using, (sql, params) = self.get_count_sql()
+        connection = connections[using]
+        if connection.vendor != 'postgresql':
+            return self.exact_count()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        estimate = plan[0]['Plan']['Plan Rows']
+        if estimate < settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD:
+            return self.exact_count()
+        self.count_mode = ESTIMATED
+        return estimate
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return len(self.object_list)
+        if self.mode == CACHED:
+            return self.cached_count()
+        if self.mode == ESTIMATED:
+            return self.estimated_count()
+        return self.exact_count()
+
+
+class CustomCursorPaginator(CursorPagination):
+    '''Keyset-пагинация без COUNT(*) и OFFSET,
+    порядок задается атрибутом cursor_ordering у view.
+    '''
+
+    page_size_query_param = 'limit'
+    page_size = 5
+    max_page_size = MAX_PAGE_SIZE
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        return super().paginate_queryset(queryset, request, view)
 
 
 class CustomPaginator(PageNumberPagination):
-    '''Кастомный пагинатор'''
+    '''Кастомный пагинатор.
+
+    По умолчанию постраничный (page/limit), способ подсчета count
+    задается в settings.PAGINATION_COUNT_MODE или методом
+    get_count_mode у view. При наличии в запросе
+    параметра cursor (в том числе пустого) переключается на
+    CustomCursorPaginator.
+    '''
 
     page_size_query_param = 'limit'
     page_size = 5
+    max_page_size = MAX_PAGE_SIZE
+    cursor_paginator_class = CustomCursorPaginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor_param = self.cursor_paginator_class.cursor_query_param
+        if cursor_param in request.query_params:
+            self.cursor_paginator = self.cursor_paginator_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        self.django_paginator_class = partial(
+            CountingPaginator, mode=self.get_count_mode(request, view)
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_mode(self, request, view):
+        if hasattr(view, 'get_count_mode'):
+            return view.get_count_mode()
+        return settings.PAGINATION_COUNT_MODE
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_mode', self.page.paginator.count_mode),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
@@ -1,11 +1,14 @@
+from collections import OrderedDict, defaultdict
+
+from django.db import transaction
 from django.forms import ValidationError
-from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 from rest_framework.relations import SlugRelatedField
 
 from djoser.serializers import UserCreateSerializer
-from drf_extra_fields.fields import Base64ImageField
 
+from .fields import Base64UploadField, ImageVariantsField, ThumbnailField
+from recipes import fragments, jobs, membership, search, shopping
 from recipes.models import (Favorited, Follow, Ingredient, Recipe,
                             RecipeIngredient, ShoppingCart, Tag, TagRecipe)
 from users.models import CustomUser
@@ -43,6 +46,8 @@ class CustomUserSerializer(serializers.ModelSerializer):
         model = CustomUser
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
@@ -128,46 +133,118 @@ class TagRecipeSerializer(serializers.ModelSerializer):
         model = TagRecipe
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
-    '''Сериализатор для вывода рецептов.'''
+class RecipeBodySerializer(serializers.ModelSerializer):
+    '''Часть рецепта, общая для всех пользователей, хранится в кэше.
+
+    Флаги пользователя выводятся как False, image и images -
+    относительными URL, их подставляет RecipeReadSerializer.
+    '''
 
     tags = TagSerializer(many=True)
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     author = CustomUserSerializer()
+    images = ImageVariantsField(source='image')
 
     class Meta:
-        fields = (
-            '__all__'
+        exclude = (
+            'favorites_count',
+            'carts_count',
+            'popularity',
         )
         model = Recipe
 
-    def get_tags(self, obj):
-        queryset = TagRecipe.objects.filter(recipe=obj)
-        return TagRecipeSerializer(queryset, many=True).data
-
     def get_ingredients(self, obj):
-        queryset = RecipeIngredient.objects.filter(recipe=obj)
-        return RecipeIngredientSerializer(queryset, many=True).data
+        return RecipeIngredientSerializer(
+            obj.recipe_ingredient.all(), many=True
+        ).data
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        return(
-            not request.user.is_anonymous
-            and Favorited.objects.filter(
-                user=request.user, recipe=obj
-            ).exists()
-        )
+        return False
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        return(
-            not request.user.is_anonymous
-            and ShoppingCart.objects.filter(
-                user=request.user, recipe=obj
-            ).exists()
+        return False
+
+
+def get_recipe_bodies(recipes):
+    '''Общие части рецептов: из кэша одним запросом,
+    отсутствующие - из БД с последующим сохранением в кэш.
+    '''
+    bodies = fragments.get_bodies(recipes)
+    missing = {recipe.id for recipe in recipes} - bodies.keys()
+    if missing:
+        loaded = {
+            recipe.id: (
+                recipe.image.name,
+                RecipeBodySerializer(recipe, context={}).data
+            )
+            for recipe in Recipe.objects.with_body().filter(id__in=missing)
+        }
+        fragments.set_bodies(loaded)
+        bodies.update(
+            (recipe_id, body) for recipe_id, (_, body) in loaded.items()
         )
+    return bodies
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    '''Загружает общие части всех рецептов страницы разом.'''
+
+    def to_representation(self, data):
+        recipes = list(data)
+        bodies = get_recipe_bodies(recipes)
+        return [
+            self.child.overlay(bodies[recipe.id], recipe)
+            for recipe in recipes if recipe.id in bodies
+        ]
+
+
+class RecipeReadSerializer(RecipeBodySerializer):
+    '''Сериализатор для вывода рецептов.
+
+    Общая часть берется из кэша (recipes.fragments), поверх нее
+    подставляются is_favorited, is_in_shopping_cart и author.is_subscribed.
+    '''
+
+    class Meta(RecipeBodySerializer.Meta):
+        list_serializer_class = RecipeListSerializer
+
+    def author_is_subscribed(self, recipe):
+        if hasattr(recipe, 'author_is_subscribed'):
+            return recipe.author_is_subscribed
+        request = self.context.get('request')
+        if not request or request.user.is_anonymous:
+            return False
+        return Follow.objects.filter(
+            user=request.user, author_id=recipe.author_id
+        ).exists()
+
+    def overlay(self, body, recipe):
+        request = self.context.get('request')
+        recipe_ids = membership.for_request(request)
+        data = OrderedDict(body)
+        data['is_favorited'] = recipe.id in recipe_ids[membership.FAVORITES]
+        data['is_in_shopping_cart'] = recipe.id in recipe_ids[membership.CART]
+        if data['author'] is not None:
+            data['author'] = OrderedDict(
+                data['author'], is_subscribed=self.author_is_subscribed(recipe)
+            )
+        if request and data['image']:
+            data['image'] = request.build_absolute_uri(data['image'])
+        if request and data['images']:
+            data['images'] = {
+                format: {
+                    width: request.build_absolute_uri(url)
+                    for width, url in urls.items()
+                }
+                for format, urls in data['images'].items()
+            }
+        return data
+
+    def to_representation(self, instance):
+        body = get_recipe_bodies([instance])[instance.id]
+        return self.overlay(body, instance)
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -178,10 +255,12 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         queryset=Tag.objects.all(),
         many=True
     )
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = Base64UploadField(max_length=None, use_url=True)
     ingredients = IngredientWriteSerializer(many=True)
     cooking_time = serializers.IntegerField()
 
+    required_fields = ('tags', 'ingredients', 'name', 'text', 'cooking_time')
+
     class Meta:
         fields = (
             '__all__'
@@ -189,28 +268,24 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         model = Recipe
 
     def calculate_ingredients(self, ingredients, recipe):
-        '''Метод для добавления ингрединтов в БД.'''
-
-        for ingredient in ingredients:
-            obj = get_object_or_404(Ingredient, id=ingredient['id'])
-            amount = ingredient['amount']
-            if RecipeIngredient.objects.filter(
-                    recipe=recipe,
-                    ingredient=obj
-            ).exists():
-                amount += ingredient['amount']
-            RecipeIngredient.objects.update_or_create(
+        '''Метод для добавления ингрединтов в БД.
+
+        ingredients уже проверены и объединены в validate_ingredients,
+        все строки вставляются одним bulk_create.
+        '''
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=recipe,
-                ingredient=obj,
-                defaults={'amount': amount}
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount']
             )
+            for ingredient in ingredients
+        )
 
     def validate(self, data):
         '''Проверка на уникальность рецепта
         и наличия обязательных полей.
         '''
-        fields = ['tags', 'ingredients', 'name', 'text', 'cooking_time']
-
         request = self.context.get('request')
         reciipe_name = data.get('name')
         reciipe_text = data.get('text')
@@ -223,14 +298,17 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                 f'{reciipe_name}': 'Рецепт с таким название уже существует!'
             })
+        return self.check_required_fields(data)
 
-        for element in fields:
+    def check_required_fields(self, data):
+        for element in self.required_fields:
             if element not in data:
                 raise ValidationError({
                     f'{element}': 'Поле отсутствует!'
                 })
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         '''Метод для создания рецепта,
         добавления ингредиентов и тегов при PATCH-запросе.
@@ -240,21 +318,78 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
+        jobs.enqueue([recipe])
 
         self.calculate_ingredients(ingredients, recipe)
+        # bulk_create не отправляет сигналы
+        search.index([recipe.pk])
         return recipe
 
+    def update_ingredients(self, ingredients, recipe):
+        '''Приводит ингредиенты рецепта к ingredients,
+        изменяя только отличающиеся строки.
+
+        Возвращает True, если что-то изменилось.
+        '''
+        current = {
+            row.ingredient_id: row for row in recipe.recipe_ingredient.all()
+        }
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = [
+            row.id for id, row in current.items() if id not in amounts
+        ]
+        changed = []
+        for id, amount in amounts.items():
+            if id in current and current[id].amount != amount:
+                current[id].amount = amount
+                changed.append(current[id])
+        added = [
+            {'id': id, 'amount': amount}
+            for id, amount in amounts.items() if id not in current
+        ]
+
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if added:
+            self.calculate_ingredients(added, recipe)
+        return bool(removed or changed or added)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        '''Метод для обновления рецепта при PATCH-запросе.'''
+        '''Метод для обновления рецепта при PATCH-запросе.
+
+        Ингредиенты, теги и поля рецепта обновляются по разнице
+        с текущим состоянием, неизмененные строки не перезаписываются.
+        '''
 
         if 'ingredients' in self.validated_data:
             ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.calculate_ingredients(ingredients, instance)
+            if self.update_ingredients(ingredients, instance):
+                # bulk-операции не отправляют сигналы
+                fragments.invalidate([instance.pk])
+                shopping.recipe_changed(instance.pk)
+                search.index([instance.pk])
 
+        # set() сам удаляет и добавляет только отличающиеся теги
         tags = validated_data.pop('tags')
         instance.tags.set(tags)
-        return super().update(instance, validated_data)
+
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        for field in changed_fields:
+            setattr(instance, field, validated_data[field])
+        if changed_fields:
+            instance.save(update_fields=changed_fields)
+        if 'image' in changed_fields:
+            jobs.enqueue([instance])
+        return instance
 
     def validate_tags(self, data):
         if len(data) == 0:
@@ -264,7 +399,12 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             })
         return data
 
-    def validate_ingredients(self, data):
+    def merge_ingredients(self, data):
+        '''Проверка id и количества ингредиентов без обращения к БД,
+        повторяющиеся ингредиенты объединяются с суммой количества.
+
+        Возвращает словарь {id: amount}.
+        '''
         for element in data:
             id = element.get('id')
             amount = element.get('amount')
@@ -286,7 +426,29 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 raise ValidationError({
                     'amount': 'Значение должно быть >= 1.'
                 })
-        return data
+
+        amounts = {}
+        for element in data:
+            amounts[element['id']] = (
+                amounts.get(element['id'], 0) + element['amount']
+            )
+        return amounts
+
+    def validate_ingredients(self, data):
+        amounts = self.merge_ingredients(data)
+        existing = set(Ingredient.objects.filter(
+            id__in=amounts
+        ).values_list('id', flat=True))
+        unknown = [id for id in amounts if id not in existing]
+        if unknown:
+            raise ValidationError({
+                'ingredients': 'Ингредиенты не найдены: {}'.format(
+                    ', '.join(str(id) for id in unknown)
+                )
+            })
+        return [
+            {'id': id, 'amount': amount} for id, amount in amounts.items()
+        ]
 
     def to_representation(self, instance):
         return RecipeReadSerializer(
@@ -297,14 +459,19 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
     '''Упрощенный сериализатор, предназначен для вывода рецептов
-    в сериализаторах ShoppingCartSerializer и SubscriptionsSerializer
+    в сериализаторах ShoppingCartSerializer и SubscriptionsSerializer,
+    image - миниатюра, остальные варианты - в images.
     '''
 
+    image = ThumbnailField()
+    images = ImageVariantsField(source='image')
+
     class Meta:
         fields = (
             'id',
             'name',
             'image',
+            'images',
             'cooking_time',
         )
         model = Recipe
@@ -335,6 +502,14 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         ).data
 
 
+class ShoppingListSerializer(serializers.Serializer):
+    '''Строка сохраненного списка покупок (recipes.shopping).'''
+
+    name = serializers.CharField()
+    measurement_unit = serializers.CharField()
+    amount = serializers.IntegerField(source='total')
+
+
 class FavoritedSerializer(serializers.ModelSerializer):
     '''Сериализатор для добавления/удаления рецептов избранное.'''
 
@@ -360,9 +535,43 @@ class FavoritedSerializer(serializers.ModelSerializer):
         ).data
 
 
+def get_recipes_limit(request):
+    '''Значение ?recipes_limit= или None, если оно не задано.'''
+
+    value = request.query_params.get('recipes_limit') if request else None
+    if value in (None, ''):
+        return None
+    try:
+        return serializers.IntegerField(min_value=0).run_validation(value)
+    except serializers.ValidationError as error:
+        raise serializers.ValidationError({'recipes_limit': error.detail})
+
+
+class SubscribersListSerializer(serializers.ListSerializer):
+    '''Загружает последние рецепты всех авторов страницы
+    одним запросом (Recipe.objects.latest_by_authors).
+    '''
+
+    def to_representation(self, data):
+        authors = list(data)
+        previews = defaultdict(list)
+        for recipe in Recipe.objects.latest_by_authors(
+            [author.id for author in authors],
+            get_recipes_limit(self.context.get('request'))
+        ):
+            previews[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipe_previews = previews[author.id]
+        return super().to_representation(authors)
+
+
 class SubscribersReadSerializer(serializers.ModelSerializer):
     '''Сериализатор для вывода данных пользователей,
     используется в FollowSerializer.
+
+    recipes_count - денормализованный счетчик, is_subscribed
+    и последние рецепты на странице подписок загружаются вместе
+    с авторами (SubscriptionsViewSet, SubscribersListSerializer).
     '''
 
     recipes = serializers.SerializerMethodField()
@@ -383,13 +592,16 @@ class SubscribersReadSerializer(serializers.ModelSerializer):
             'recipes_count',
         )
         model = CustomUser
+        list_serializer_class = SubscribersListSerializer
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        return obj.recipes_count
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
-        return(
+        return (
             not request.user.is_anonymous
             and Follow.objects.filter(
                 user=obj,
@@ -398,12 +610,11 @@ class SubscribersReadSerializer(serializers.ModelSerializer):
         )
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
-            recipes = obj.recipes.all()[:int(recipes_limit)]
-        else:
-            recipes = obj.recipes.all()
+        recipes = getattr(obj, 'recipe_previews', None)
+        if recipes is None:
+            recipes = Recipe.objects.latest_by_authors(
+                [obj.id], get_recipes_limit(self.context.get('request'))
+            )
 
         return ShortRecipeSerializer(
             recipes,
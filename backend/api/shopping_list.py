@@ -0,0 +1,53 @@
+from django.conf import settings
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+FONT_NAME = 'FreeSans'
+FONT_SIZE = 12
+PAGE_WIDTH, PAGE_HEIGHT = A4
+# координаты в пунктах от левого нижнего угла страницы
+HEADER_Y = 800
+FIRST_LINE_Y = 750
+BOTTOM_Y = 50
+LINE_HEIGHT = 30
+
+
+def register_fonts():
+    '''Регистрирует шрифт списка покупок, вызывается один раз
+    при запуске приложения (ApiConfig.ready).
+    '''
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, settings.FONT_PATH))
+
+
+def draw_header(pdf, username, page):
+    pdf.setFont(FONT_NAME, FONT_SIZE)
+    pdf.drawString(50, HEADER_Y, 'Список ингредиентов')
+    pdf.drawString(400, HEADER_Y, f'Пользователь: {username}')
+    pdf.line(0, HEADER_Y - 10, PAGE_WIDTH, HEADER_Y - 10)
+    if page > 1:
+        pdf.drawRightString(PAGE_WIDTH - 50, BOTTOM_Y - 30, f'Стр. {page}')
+
+
+def render_pdf(lines, username, file):
+    '''Записывает строки списка покупок lines в PDF-файл file,
+    перенося их на новые страницы; заголовок повторяется на каждой.
+    '''
+    pdf = canvas.Canvas(file, pagesize=A4)
+    page = 1
+    draw_header(pdf, username, page)
+    height = FIRST_LINE_Y
+    for line in lines:
+        if height < BOTTOM_Y:
+            pdf.showPage()
+            page += 1
+            draw_header(pdf, username, page)
+            height = FIRST_LINE_Y
+        pdf.drawString(50, height, line)
+        height -= LINE_HEIGHT
+    pdf.showPage()
+    pdf.save()
+    return page
@@ -0,0 +1,248 @@
+import json
+import os
+import statistics
+import time
+import tracemalloc
+import unittest
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from .utils import create_user, seed, seed_activity
+from recipes import search
+from recipes.shopping import shopping_list
+
+BENCHMARK = os.environ.get('FOODGRAM_BENCHMARK')
+SIZES = [
+    int(size) for size in os.environ.get(
+        'FOODGRAM_BENCHMARK_SIZES', '100,10000,100000'
+    ).split(',')
+]
+REPEATS = int(os.environ.get('FOODGRAM_BENCHMARK_REPEATS', 5))
+OUTPUT = os.environ.get('FOODGRAM_BENCHMARK_OUTPUT')
+SEARCH_SIZES = [
+    int(size) for size in os.environ.get(
+        'FOODGRAM_BENCHMARK_SEARCH_SIZES', '1000000'
+    ).split(',')
+]
+
+
+class Benchmark(APITestCase):
+
+    def measure(self, url):
+        timings = []
+        for _ in range(REPEATS):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = self.client.get(url)
+                if response.streaming:
+                    content = b''.join(response.streaming_content)
+                else:
+                    content = response.content
+                timings.append(time.perf_counter() - start)
+            self.assertEqual(response.status_code, 200, url)
+        return {
+            'median_ms': round(statistics.median(timings) * 1000, 2),
+            'max_ms': round(max(timings) * 1000, 2),
+            'queries': len(context),
+            'bytes': len(content),
+        }
+
+
+@unittest.skipUnless(BENCHMARK, 'задайте FOODGRAM_BENCHMARK=1')
+class LatencyBenchmark(Benchmark):
+    '''Время ответа эндпоинтов на наборах данных разного размера.
+
+    Запуск:
+    FOODGRAM_BENCHMARK=1 python manage.py test api.tests.test_benchmarks
+    Размеры задаются в FOODGRAM_BENCHMARK_SIZES, результат в формате JSON
+    пишется в файл FOODGRAM_BENCHMARK_OUTPUT.
+    '''
+
+    urls = (
+        '/api/recipes/',
+        '/api/recipes/?limit=50',
+        '/api/recipes/?tags=tag0&tags=tag1',
+        '/api/recipes/?is_favorited=1',
+        '/api/recipes/?ordering=popular&cursor=',
+        '/api/recipes/?ordering=popular&tags=tag0&tags=tag1&cursor=',
+        '/api/recipes/{recipe_id}/',
+        '/api/recipes/download_shopping_cart/',
+        '/api/users/subscriptions/?recipes_limit=3',
+        '/api/recipes/feed/?limit=50',
+        '/api/ingredients/?name=ингредиент 1',
+        '/api/tags/',
+    )
+
+    def test_latency(self):
+        report = {}
+        for size in SIZES:
+            with transaction.atomic():
+                data = seed(recipes=size, authors=max(size // 20, 5))
+                user = create_user('benchmark')
+                seed_activity(user, data, favorites=20, cart=20, follows=10)
+                self.client.force_authenticate(user)
+                report[size] = {
+                    url: self.measure(
+                        url.format(recipe_id=data['recipe_ids'][0])
+                    )
+                    for url in self.urls
+                }
+                transaction.set_rollback(True)
+
+        for size, results in report.items():
+            print(f'\n{size} рецептов:')
+            for url, result in results.items():
+                print(
+                    f'  {url:<45} {result["median_ms"]:>9} мс '
+                    f'(max {result["max_ms"]} мс, '
+                    f'{result["queries"]} запросов)'
+                )
+        if OUTPUT:
+            with open(OUTPUT, 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+
+
+@unittest.skipUnless(BENCHMARK, 'задайте FOODGRAM_BENCHMARK=1')
+class ShoppingListBenchmark(Benchmark):
+    '''Выгрузка списка покупок из 10, 100 и 1000 ингредиентов
+    в каждом формате: время ответа и пик памяти Python (tracemalloc).
+    '''
+
+    sizes = (10, 100, 1000)
+    formats = ('pdf', 'txt', 'csv', 'json')
+
+    def peak_memory(self, url):
+        tracemalloc.start()
+        response = self.client.get(url)
+        b''.join(response.streaming_content)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return round(peak / 1024)
+
+    def test_download(self):
+        report = {}
+        for size in self.sizes:
+            with transaction.atomic():
+                # каждый ингредиент встречается в списке ровно один раз
+                data = seed(
+                    recipes=size, ingredients=size, ingredients_per_recipe=1
+                )
+                user = create_user('benchmark')
+                seed_activity(
+                    user, data, favorites=0, cart=len(data['recipe_ids']),
+                    follows=0
+                )
+                self.client.force_authenticate(user)
+                for format in self.formats:
+                    url = (
+                        '/api/recipes/download_shopping_cart/'
+                        f'?format={format}'
+                    )
+                    result = self.measure(url)
+                    result['peak_kb'] = self.peak_memory(url)
+                    report[f'{size} {format}'] = result
+                transaction.set_rollback(True)
+
+        print()
+        for name, result in report.items():
+            print(
+                f'  {name:>9} {result["median_ms"]:>9} мс '
+                f'(max {result["max_ms"]} мс, {result["bytes"]} байт, '
+                f'пик памяти {result["peak_kb"]} КБ)'
+            )
+
+
+@unittest.skipUnless(BENCHMARK, 'задайте FOODGRAM_BENCHMARK=1')
+class CartSizeBenchmark(Benchmark):
+    '''Список покупок при корзине из 10 / 100 / 1000 / 10000 рецептов
+    (по 10 ингредиентов в каждом): чтение сохраненного списка
+    shopping_list() и эндпоинты, которые его отдают. Время должно
+    зависеть от числа строк списка, а не от размера корзины.
+    '''
+
+    sizes = (10, 100, 1000, 10000)
+    urls = (
+        '/api/recipes/shopping_list/',
+        '/api/recipes/download_shopping_cart/?format=txt',
+    )
+
+    def test_cart_size(self):
+        report = {}
+        for size in self.sizes:
+            with transaction.atomic():
+                data = seed(recipes=size, ingredients=500)
+                user = create_user('benchmark')
+                seed_activity(
+                    user, data, favorites=0, cart=size, follows=0
+                )
+                self.client.force_authenticate(user)
+                timings = []
+                for _ in range(REPEATS):
+                    start = time.perf_counter()
+                    rows = len(list(shopping_list(user)))
+                    timings.append(time.perf_counter() - start)
+                report[size] = {
+                    'shopping_list()': {
+                        'median_ms': round(
+                            statistics.median(timings) * 1000, 2
+                        ),
+                        'rows': rows,
+                    },
+                    **{url: self.measure(url) for url in self.urls},
+                }
+                transaction.set_rollback(True)
+
+        for size, results in report.items():
+            print(f'\n{size} рецептов в корзине:')
+            for name, result in results.items():
+                details = (
+                    f'{result["rows"]} строк' if 'rows' in result
+                    else f'{result["queries"]} запросов'
+                )
+                print(f'  {name:<50} {result["median_ms"]:>9} мс ({details})')
+
+
+@unittest.skipUnless(BENCHMARK, 'задайте FOODGRAM_BENCHMARK=1')
+class SearchBenchmark(Benchmark):
+    '''Поиск ?search= на 1M рецептов (FOODGRAM_BENCHMARK_SEARCH_SIZES):
+    время ответа и полной пересборки поискового индекса.
+    '''
+
+    urls = (
+        # совпадают все рецепты
+        '/api/recipes/?search=рецепт',
+        '/api/recipes/?search=рецепт&cursor=',
+        # один рецепт
+        '/api/recipes/?search=рецепт 123456',
+        '/api/recipes/?search=ингредиент 17&tags=tag0',
+        '/api/recipes/?search=ингредиент 17&ordering=popular&cursor=',
+    )
+
+    def test_search(self):
+        report = {}
+        for size in SEARCH_SIZES:
+            with transaction.atomic():
+                seed(
+                    recipes=size, authors=100, ingredients=500,
+                    ingredients_per_recipe=3
+                )
+                start = time.perf_counter()
+                search.index()
+                report[size] = {
+                    'index_s': round(time.perf_counter() - start, 1)
+                }
+                self.client.force_authenticate(create_user('benchmark'))
+                for url in self.urls:
+                    report[size][url] = self.measure(url)
+                transaction.set_rollback(True)
+
+        for size, results in report.items():
+            print(f'\n{size} рецептов, индекс {results.pop("index_s")} с:')
+            for url, result in results.items():
+                print(
+                    f'  {url:<60} {result["median_ms"]:>9} мс '
+                    f'(max {result["max_ms"]} мс, '
+                    f'{result["queries"]} запросов)'
+                )
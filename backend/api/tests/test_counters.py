@@ -0,0 +1,102 @@
+from io import StringIO
+
+from django.core.management import call_command
+
+from .utils import FoodgramTestCase, create_user, seed
+from recipes.models import Favorited, Follow, Recipe, ShoppingCart
+from users.models import CustomUser
+
+
+class DenormalizedCountersTests(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=6, authors=2)
+        cls.user = create_user('reader')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.get(pk=self.data['recipe_ids'][0])
+
+    def assert_counters_consistent(self):
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                recipe.favorites_count, recipe.recipes_fav.count()
+            )
+            self.assertEqual(recipe.carts_count, recipe.recipes_shop.count())
+        for user in CustomUser.objects.all():
+            self.assertEqual(user.recipes_count, user.recipes.count())
+            self.assertEqual(user.followers_count, user.following.count())
+
+    def test_favorite_and_unfavorite(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.client.post(url)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.client.delete(url)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_recipe_create_delete_and_reassign(self):
+        author = CustomUser.objects.get(pk=self.data['authors'][0].pk)
+        before = author.recipes_count
+        recipe = Recipe.objects.create(
+            author=author, name='Новый', text='Текст', cooking_time=1
+        )
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, before + 1)
+
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        recipe.author = self.user
+        recipe.save()
+        self.assert_counters_consistent()
+
+        recipe.delete()
+        self.assert_counters_consistent()
+
+    def test_cascade_user_delete(self):
+        fan = create_user('fan')
+        Favorited.objects.create(user=fan, recipe=self.recipe)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        fan.delete()
+        self.assert_counters_consistent()
+
+    def test_concurrent_delete_counted_once(self):
+        author = self.data['authors'][0]
+        Favorited.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        Follow.objects.create(user=self.user, author=author)
+        for model, filters in (
+            (Favorited, {'recipe': self.recipe}),
+            (ShoppingCart, {'recipe': self.recipe}),
+            (Follow, {'author': author}),
+        ):
+            # оба запроса загрузили строку, второй удаляет 0 строк
+            first = model.objects.get(user=self.user, **filters)
+            second = model.objects.get(pk=first.pk)
+            first.delete()
+            second.delete()
+        self.assert_counters_consistent()
+
+    def test_subscriptions_recipes_count(self):
+        author = self.data['authors'][1]
+        self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assert_counters_consistent()
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(
+            response.data['results'][0]['recipes_count'],
+            author.recipes.count()
+        )
+        self.client.delete(f'/api/users/{author.id}/subscribe/')
+        self.assert_counters_consistent()
+
+    def test_rebuild_reports_and_fixes_drift(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(favorites_count=7)
+        output = StringIO()
+        call_command('rebuild_counters', stdout=output)
+        self.assertIn(
+            f'favorites_count id={self.recipe.pk}', output.getvalue()
+        )
+        self.assert_counters_consistent()
@@ -0,0 +1,157 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .utils import FoodgramTestCase, create_user, max_queries, seed
+from recipes import membership
+from recipes.feed import rebuild_feeds
+from recipes.models import FeedEntry, Follow, Recipe
+from users.models import CustomUser
+
+
+class FeedTests(FoodgramTestCase):
+
+    url = '/api/recipes/feed/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=30, authors=3)
+        cls.user = create_user('reader')
+        cls.author, cls.other, cls.unfollowed = cls.data['authors']
+        for author in (cls.author, cls.other):
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        # множества избранного и корзины уже в кэше
+        membership.get_recipe_ids(self.user)
+
+    def expected(self, *authors):
+        return list(Recipe.objects.filter(author__in=authors).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def create_recipe(self, author):
+        return Recipe.objects.create(
+            author=author, name='Новый', text='Текст',
+            image='recipes/seed.png', cooking_time=1
+        )
+
+    def test_follow_backfills_feed(self):
+        self.assertEqual(
+            self.walk(f'{self.url}?limit=4'),
+            self.expected(self.author, self.other)
+        )
+
+    @override_settings(FEED_BACKFILL_SIZE=3)
+    def test_backfill_size(self):
+        fan = create_user('fan')
+        Follow.objects.create(user=fan, author=self.author)
+        self.assertEqual(
+            list(FeedEntry.objects.filter(user=fan).order_by(
+                '-pub_date', '-recipe'
+            ).values_list('recipe', flat=True)),
+            self.expected(self.author)[:3]
+        )
+
+    def test_new_recipe_fans_out(self):
+        recipe = self.create_recipe(self.author)
+        self.create_recipe(self.unfollowed)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['id'], recipe.id)
+        self.assertEqual(
+            self.walk(self.url), self.expected(self.author, self.other)
+        )
+
+    def test_unfollow_trims_feed(self):
+        response = self.client.delete(f'/api/users/{self.other.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.walk(self.url), self.expected(self.author))
+
+    def test_author_change_moves_recipe(self):
+        recipe = self.create_recipe(self.unfollowed)
+        recipe.author = self.author
+        recipe.save()
+        self.assertIn(recipe.id, self.walk(self.url))
+        recipe.author = self.unfollowed
+        recipe.save()
+        self.assertNotIn(recipe.id, self.walk(self.url))
+
+    def feed_on_read(self, author):
+        return CustomUser.objects.get(pk=author.pk).feed_on_read
+
+    @override_settings(
+        FEED_FANOUT_MAX_FOLLOWERS=2, FEED_FANOUT_RESUME_FOLLOWERS=1
+    )
+    def test_fanout_threshold_crossing(self):
+        fans = [create_user(f'fan{number}') for number in range(2)]
+        follows = [
+            Follow.objects.create(user=fan, author=self.other)
+            for fan in fans
+        ]
+        self.assertTrue(self.feed_on_read(self.other))
+        recipe = self.create_recipe(self.other)
+        self.assertFalse(FeedEntry.objects.filter(recipe=recipe).exists())
+        expected = self.expected(self.author, self.other)
+        self.assertEqual(self.walk(f'{self.url}?limit=7'), expected)
+        # между порогами автор не переключается
+        follows[1].delete()
+        self.assertTrue(self.feed_on_read(self.other))
+        follows[0].delete()
+        self.assertFalse(self.feed_on_read(self.other))
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user, recipe=recipe).exists()
+        )
+        self.assertEqual(self.walk(f'{self.url}?limit=7'), expected)
+        self.assertEqual(
+            self.walk(f'{self.url}?limit=7'),
+            list(FeedEntry.objects.filter(user=self.user).order_by(
+                '-pub_date', '-recipe'
+            ).values_list('recipe', flat=True))
+        )
+
+    def test_single_query_per_page(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'{self.url}?limit=5')
+        feed_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'recipes_feedentry' in query['sql']
+        ]
+        self.assertEqual(len(feed_queries), 1)
+        self.assertIn('LIMIT', feed_queries[0])
+        self.assertNotIn('OFFSET', feed_queries[0])
+        self.assertNotIn('count', response.data)
+
+    def test_queries_do_not_depend_on_page_size(self):
+        for limit in (1, 10):
+            with self.subTest(limit=limit), max_queries(self, 5):
+                response = self.client.get(self.url, {'limit': limit})
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_rebuild_feeds(self):
+        FeedEntry.objects.filter(user=self.user, author=self.other).delete()
+        self.assertEqual(rebuild_feeds([self.user.id]), 1)
+        self.assertEqual(
+            self.walk(self.url), self.expected(self.author, self.other)
+        )
+        output = StringIO()
+        call_command('rebuild_feeds', stdout=output)
+        self.assertIn('1', output.getvalue())
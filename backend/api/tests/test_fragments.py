@@ -0,0 +1,71 @@
+from .utils import FoodgramTestCase, create_user, max_queries, seed
+from recipes.models import Follow, Ingredient, Recipe, Tag
+from users.models import CustomUser
+
+
+class RecipeFragmentCacheTests(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=4, authors=2)
+        cls.user = create_user('reader')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.get(pk=self.data['recipe_ids'][0])
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_body_cached_flags_per_user(self):
+        data = self.get()
+        self.assertTrue(data['image'].startswith('http://testserver/media/'))
+        Follow.objects.create(user=self.user, author=self.recipe.author)
+        self.client.post(f'{self.url}favorite/')
+        with max_queries(self, 1):
+            data = self.get()
+        self.assertTrue(data['is_favorited'])
+        self.assertFalse(data['is_in_shopping_cart'])
+        self.assertTrue(data['author']['is_subscribed'])
+
+        self.client.force_authenticate(None)
+        with max_queries(self, 1):
+            data = self.get()
+        self.assertFalse(data['is_favorited'])
+        self.assertFalse(data['author']['is_subscribed'])
+
+    def test_invalidated_on_recipe_change(self):
+        self.get()
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        recipe.name = 'Новое название'
+        recipe.save()
+        self.assertEqual(self.get()['name'], 'Новое название')
+
+        recipe.tags.set(self.data['tags'])
+        self.assertEqual(len(self.get()['tags']), len(self.data['tags']))
+
+        recipe.recipe_ingredient.first().delete()
+        self.assertEqual(len(self.get()['ingredients']), 9)
+
+    def test_invalidated_on_catalog_change(self):
+        data = self.get()
+        ingredient = Ingredient.objects.get(pk=data['ingredients'][0]['id'])
+        ingredient.name = 'переименован'
+        ingredient.save()
+        tag = Tag.objects.get(pk=data['tags'][0]['id'])
+        tag.name = 'Новый тег'
+        tag.save()
+        data = self.get()
+        self.assertEqual(data['ingredients'][0]['name'], 'переименован')
+        self.assertEqual(data['tags'][0]['name'], 'Новый тег')
+
+    def test_invalidated_on_author_change(self):
+        self.get()
+        author = CustomUser.objects.get(pk=self.recipe.author_id)
+        author.first_name = 'Иван'
+        author.save()
+        self.assertEqual(self.get()['author']['first_name'], 'Иван')
@@ -0,0 +1,75 @@
+from django.core.cache import cache
+from django.db.models import F
+from django.test import override_settings
+
+from .utils import FoodgramTestCase, max_queries
+from recipes.models import CatalogVersion, Ingredient, Tag
+from recipes.versions import TAGS
+
+
+class CatalogHttpCacheTests(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+
+    def assert_revalidates(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('max-age', response['Cache-Control'])
+
+        with max_queries(self, 0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def rename_tag(self):
+        tag = Tag.objects.get(pk=self.tag.pk)
+        tag.name = 'Ранний завтрак'
+        tag.save()
+
+    def test_tags(self):
+        self.assert_revalidates('/api/tags/', self.rename_tag)
+
+    def test_tag_detail(self):
+        self.assert_revalidates(f'/api/tags/{self.tag.id}/', self.rename_tag)
+
+    def test_ingredients(self):
+        def change():
+            Ingredient.objects.create(
+                name=f'сахар {Ingredient.objects.count()}',
+                measurement_unit='г'
+            )
+
+        self.assert_revalidates('/api/ingredients/', change)
+        self.assert_revalidates('/api/ingredients/?name=с', change)
+
+    def test_etag_depends_on_query(self):
+        first = self.client.get('/api/ingredients/?name=с')['ETag']
+        second = self.client.get('/api/ingredients/?name=со')['ETag']
+        self.assertNotEqual(first, second)
+
+    def test_version_shared_through_db(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        # кэш другого процесса не влияет на версию
+        cache.clear()
+        self.assertEqual(self.client.get('/api/tags/')['ETag'], etag)
+        # изменение, сделанное в другом процессе (upload_data, админка),
+        # видно после CATALOG_VERSION_TTL
+        CatalogVersion.objects.filter(name=TAGS).update(
+            version=F('version') + 1
+        )
+        self.assertEqual(self.client.get('/api/tags/')['ETag'], etag)
+        with override_settings(CATALOG_VERSION_TTL=0):
+            self.assertNotEqual(self.client.get('/api/tags/')['ETag'], etag)
@@ -0,0 +1,229 @@
+import base64
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import override_settings
+
+from PIL import Image
+
+from .utils import FoodgramTestCase, create_user, seed
+from api.fields import decode_base64
+from recipes.models import ImageJob, Recipe
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def photo_base64(size=(1600, 800), orientation=6):
+    '''JPEG с EXIF-тегом поворота, как у снимков с телефона.'''
+
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x010f] = 'Camera'
+    output = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(output, 'JPEG', exif=exif)
+    return 'data:image/jpeg;base64,' + base64.b64encode(
+        output.getvalue()
+    ).decode()
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WIDTHS=(200, 600, 1200)
+)
+class ImageProcessingTests(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=1, authors=1, ingredients=5)
+        cls.user = create_user('cook')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def payload(self, image):
+        return {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image,
+            'tags': [self.data['tags'][0].id],
+            'ingredients': [
+                {'id': self.data['ingredient_ids'][0], 'amount': 1}
+            ],
+        }
+
+    def process(self):
+        call_command(
+            'process_images', workers=0, once=True, stdout=StringIO(),
+            stderr=StringIO()
+        )
+
+    def test_upload_is_processed_in_background(self):
+        response = self.client.post(
+            '/api/recipes/', self.payload(photo_base64()), format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        source = recipe.image.name
+        self.assertTrue(source.startswith('recipes/uploads/'))
+        job = recipe.image_jobs.get()
+        self.assertEqual(job.status, ImageJob.PENDING)
+
+        self.process()
+
+        recipe.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.DONE)
+        self.assertFalse(default_storage.exists(source))
+        self.assertRegex(
+            recipe.image.name, r'^recipes/[0-9a-f]{20}/1200\.jpg$'
+        )
+        key = recipe.image.name.split('/')[1]
+        # повернута по EXIF, уже 1200 px и не увеличивается
+        sizes = {200: (200, 400), 600: (600, 1200), 1200: (800, 1600)}
+        for width, size in sizes.items():
+            for extension, format in (('jpg', 'JPEG'), ('webp', 'WEBP')):
+                name = f'recipes/{key}/{width}.{extension}'
+                with default_storage.open(name) as file:
+                    image = Image.open(file)
+                    self.assertEqual(image.format, format)
+                    self.assertEqual(image.size, size)
+                    self.assertEqual(len(image.getexif()), 0)
+
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertTrue(response.data['image'].endswith(recipe.image.name))
+        self.assertEqual(
+            response.data['images']['webp']['200'],
+            f'http://testserver/media/recipes/{key}/200.webp'
+        )
+
+        response = self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(
+            response.data['image'],
+            f'http://testserver/media/recipes/{key}/200.jpg'
+        )
+        self.assertEqual(
+            response.data['images']['jpeg']['1200'],
+            f'http://testserver{recipe.image.url}'
+        )
+
+    def test_body_cached_by_other_process_is_not_served(self):
+        response = self.client.post(
+            '/api/recipes/', self.payload(photo_base64()), format='json'
+        )
+        recipe_id = response.data['id']
+        source = Recipe.objects.get(id=recipe_id).image.name
+        self.client.get(f'/api/recipes/{recipe_id}/')
+        # сброс кэша в image_worker не доходит до этого процесса
+        with mock.patch('recipes.fragments.invalidate'):
+            self.process()
+        self.assertFalse(default_storage.exists(source))
+
+        image = Recipe.objects.get(id=recipe_id).image.name
+        response = self.client.get(f'/api/recipes/{recipe_id}/')
+        self.assertTrue(response.data['image'].endswith(image))
+        self.assertIsNotNone(response.data['images'])
+
+    def test_same_content_is_stored_once(self):
+        image = photo_base64(size=(300, 300), orientation=1)
+        ids = [
+            self.client.post('/api/recipes/', dict(
+                self.payload(image), name=f'Рецепт {number}'
+            ), format='json').data['id']
+            for number in range(2)
+        ]
+        self.process()
+        names = set(Recipe.objects.filter(
+            id__in=ids
+        ).values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+
+    def test_unprocessed_image_has_no_variants(self):
+        recipe = Recipe.objects.get(id=self.data['recipe_ids'][0])
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertIsNone(response.data['images'])
+        response = self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(
+            response.data['image'], 'http://testserver/media/recipes/seed.png'
+        )
+
+        call_command(
+            'process_images', workers=0, once=True, enqueue='unprocessed',
+            stdout=StringIO(), stderr=StringIO()
+        )
+        self.assertEqual(recipe.image_jobs.get().status, ImageJob.FAILED)
+
+    def test_not_an_image_is_rejected(self):
+        response = self.client.post('/api/recipes/', self.payload(
+            base64.b64encode(b'not an image').decode()
+        ), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1024)
+    def test_oversized_image_is_rejected_before_decoding(self):
+        with mock.patch('api.fields.decode_base64') as decode:
+            response = self.client.post(
+                '/api/recipes/', self.payload(photo_base64()), format='json'
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Размер картинки', str(response.data['image']))
+        decode.assert_not_called()
+
+    @override_settings(RECIPE_MAX_BODY_SIZE=1024)
+    def test_oversized_body_is_rejected_before_parsing(self):
+        with mock.patch('api.fields.decode_base64') as decode:
+            response = self.client.post(
+                '/api/recipes/', self.payload(photo_base64()), format='json'
+            )
+        self.assertEqual(response.status_code, 413)
+        decode.assert_not_called()
+
+    @override_settings(IMAGE_MAX_PIXELS=1000 * 1000)
+    def test_dimensions_are_checked_from_header(self):
+        response = self.client.post(
+            '/api/recipes/', self.payload(photo_base64()), format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1600x800', str(response.data['image']))
+
+    @override_settings(IMAGE_UPLOAD_SPOOL_SIZE=1024)
+    def test_large_upload_is_spooled_to_disk(self):
+        image = photo_base64()
+        header, payload = image.split(',')
+        # base64 с переводами строк, как из некоторых клиентов
+        wrapped = '\n'.join(
+            payload[i:i + 76] for i in range(0, len(payload), 76)
+        )
+        for data in (image, f'{header},{wrapped}'):
+            decoded = decode_base64(data, len(header) + 1)
+            self.assertTrue(decoded._rolled)
+            self.assertEqual(
+                decoded.read(), base64.b64decode(payload)
+            )
+        response = self.client.post('/api/recipes/', dict(
+            self.payload(f'{header},{wrapped}'), name='Рецепт 2'
+        ), format='json')
+        self.assertEqual(response.status_code, 201)
+
+    @override_settings(IMAGE_JOB_MAX_ATTEMPTS=2)
+    def test_failed_job_is_retried_then_marked_failed(self):
+        recipe = Recipe.objects.get(id=self.data['recipe_ids'][0])
+        job = ImageJob.objects.create(recipe=recipe, source='recipes/nope')
+
+        self.process()
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertTrue(job.error)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image.name, 'recipes/seed.png')
@@ -0,0 +1,171 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from .utils import PNG, FoodgramTestCase, create_user, max_queries, seed
+from recipes.models import Recipe
+from users.models import CustomUser
+
+MEDIA_ROOT = tempfile.mkdtemp()
+IMAGE_DIR = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPE_IMPORT_IMAGE_DIR=IMAGE_DIR)
+class RecipeImportTests(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=1, authors=1, ingredients=10)
+        cls.admin = create_user('admin')
+        cls.admin.is_staff = True
+        cls.admin.save()
+        with open(os.path.join(IMAGE_DIR, 'dish.png'), 'wb') as image:
+            image.write(PNG)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(IMAGE_DIR, ignore_errors=True)
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.author = self.data['authors'][0]
+        self.ingredient_ids = self.data['ingredient_ids']
+
+    def row(self, number, **fields):
+        row = {
+            'name': f'Импорт {number}',
+            'text': 'Описание',
+            'cooking_time': 15,
+            'image': 'dish.png',
+            'author': self.author.username,
+            'tags': [self.data['tags'][0].slug, self.data['tags'][1].id],
+            'ingredients': [
+                {'id': self.ingredient_ids[0], 'amount': 2},
+                {'id': self.ingredient_ids[1], 'amount': 1},
+                {'id': self.ingredient_ids[0], 'amount': 3},
+            ],
+        }
+        row.update(fields)
+        return json.dumps(row, ensure_ascii=False)
+
+    def write_file(self, lines):
+        path = os.path.join(self.tmp, 'recipes.ndjson')
+        with open(path, 'w', encoding='utf-8') as nf:
+            nf.write('\n'.join(lines) + '\n')
+        return path
+
+    def run_command(self, path, **options):
+        errors = os.path.join(self.tmp, 'errors.ndjson')
+        call_command(
+            'import_recipes', path, errors=errors, stdout=StringIO(),
+            **options
+        )
+        with open(errors, encoding='utf-8') as ef:
+            return [json.loads(line) for line in ef]
+
+    def test_command_imports_valid_rows_and_reports_errors(self):
+        path = self.write_file([
+            self.row(1),
+            'не json',
+            self.row(2, tags=['nope']),
+            self.row(3, ingredients=[{'id': 100500, 'amount': 1}]),
+            self.row(4, image='../etc/passwd'),
+            self.row(5, author='ghost'),
+            self.row(1),
+            self.row(6, cooking_time='долго'),
+            self.row(7),
+        ])
+        before = CustomUser.objects.get(pk=self.author.pk).recipes_count
+
+        errors = self.run_command(path, batch_size=4)
+
+        self.assertEqual(
+            [error['line'] for error in errors], [2, 3, 4, 5, 6, 7, 8]
+        )
+        self.assertIn('tags', errors[1]['errors'])
+        self.assertIn('100500', str(errors[2]['errors']))
+        self.assertIn('image', errors[3]['errors'])
+        self.assertIn('author', errors[4]['errors'])
+        self.assertIn('Импорт 1', errors[5]['errors'])
+        self.assertIn('cooking_time', errors[6]['errors'])
+
+        recipes = Recipe.objects.filter(name__startswith='Импорт')
+        self.assertEqual(
+            sorted(recipes.values_list('name', flat=True)),
+            ['Импорт 1', 'Импорт 7']
+        )
+        recipe = recipes.get(name='Импорт 1')
+        self.assertEqual(
+            dict(recipe.recipe_ingredient.values_list(
+                'ingredient_id', 'amount'
+            )),
+            {self.ingredient_ids[0]: 5, self.ingredient_ids[1]: 1}
+        )
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertTrue(recipe.image.name.startswith('recipes/'))
+        self.assertEqual(
+            CustomUser.objects.get(pk=self.author.pk).recipes_count,
+            before + 2
+        )
+
+    def test_command_resumes_from_state(self):
+        path = self.write_file([self.row(number) for number in range(1, 6)])
+        state = os.path.join(self.tmp, 'state')
+        with open(state, 'w') as sf:
+            sf.write('3')
+
+        self.run_command(path, state=state, batch_size=2)
+
+        self.assertEqual(
+            sorted(Recipe.objects.filter(
+                name__startswith='Импорт'
+            ).values_list('name', flat=True)),
+            ['Импорт 4', 'Импорт 5']
+        )
+        with open(state) as sf:
+            self.assertEqual(sf.read(), '5')
+
+    def test_batch_uses_fixed_number_of_queries(self):
+        path = self.write_file([self.row(number) for number in range(50)])
+        with max_queries(self, 15):
+            self.run_command(path, batch_size=50)
+        self.assertEqual(
+            Recipe.objects.filter(name__startswith='Импорт').count(), 50
+        )
+
+    def test_endpoint_is_admin_only(self):
+        body = self.row(1)
+        self.client.force_authenticate(self.author)
+        response = self.client.post(
+            '/api/recipes/import/', body, content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.post(
+            '/api/recipes/import/',
+            '\n'.join([self.row(1), self.row(2, tags=[])]),
+            content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(response.data['last_line'], 2)
+        self.assertEqual(response.data['errors'][0]['line'], 2)
+
+        response = self.client.post(
+            '/api/recipes/import/?start_line=1',
+            '\n'.join([self.row(1), self.row(3)]),
+            content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'], [])
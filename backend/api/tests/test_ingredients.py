@@ -0,0 +1,66 @@
+from .utils import FoodgramTestCase, max_queries
+from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS, bump_version
+
+
+class IngredientSearchTests(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in (
+                'соль морская', 'соль', 'Солод', 'сода', 'соль крупная',
+                'свёкла', 'свекольный сок', 'перец',
+            )
+        )
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+
+    def setUp(self):
+        super().setUp()
+        # bulk_create не отправляет сигналы
+        bump_version(INGREDIENTS)
+
+    def search(self, name, limit=None):
+        url = f'/api/ingredients/?name={name}'
+        if limit:
+            url += f'&limit={limit}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data]
+
+    def test_order_exact_then_shorter(self):
+        self.assertEqual(
+            self.search('соль'),
+            ['соль', 'соль крупная', 'соль морская']
+        )
+        self.assertEqual(
+            self.search('СОЛ'),
+            ['соль', 'Солод', 'соль крупная', 'соль морская']
+        )
+
+    def test_limit(self):
+        self.assertEqual(self.search('со', limit=2), ['сода', 'соль'])
+
+    def test_yo_normalization(self):
+        self.assertEqual(self.search('свек'), ['свёкла', 'свекольный сок'])
+        self.assertEqual(self.search('свёк'), ['свёкла', 'свекольный сок'])
+
+    def test_no_queries_on_warm_index(self):
+        self.search('с')
+        with max_queries(self, 0):
+            self.search('са')
+
+    def test_rebuild_on_catalog_change(self):
+        self.assertEqual(self.search('перец'), ['перец'])
+        Ingredient.objects.create(name='перец чили', measurement_unit='г')
+        self.assertEqual(self.search('перец'), ['перец', 'перец чили'])
+        Ingredient.objects.filter(name='перец').get().delete()
+        self.assertEqual(self.search('перец'), ['перец чили'])
+
+    def test_fields(self):
+        response = self.client.get('/api/ingredients/?name=сахар')
+        ingredient = Ingredient.objects.get(name='сахар')
+        self.assertEqual(response.data, [{
+            'id': ingredient.id, 'name': 'сахар', 'measurement_unit': 'г'
+        }])
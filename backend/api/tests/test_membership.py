@@ -0,0 +1,82 @@
+from django.core.cache import cache
+
+from .utils import FoodgramTestCase, create_user, max_queries, seed
+from recipes import membership
+from recipes.models import Recipe
+
+
+class MembershipCacheTests(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=6, authors=2)
+        cls.user = create_user('reader')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.recipe_id = self.data['recipe_ids'][0]
+
+    def cached(self, kind):
+        version = membership.get_versions(self.user.id)[kind]
+        return cache.get(membership.cache_key(self.user.id, kind, version))
+
+    def flags(self):
+        response = self.client.get(f'/api/recipes/{self.recipe_id}/')
+        return (
+            response.data['is_favorited'], response.data['is_in_shopping_cart']
+        )
+
+    def test_invalidation(self):
+        self.assertEqual(self.flags(), (False, False))
+        self.assertEqual(self.cached(membership.FAVORITES), frozenset())
+
+        self.client.post(f'/api/recipes/{self.recipe_id}/favorite/')
+        self.client.post(f'/api/recipes/{self.recipe_id}/shopping_cart/')
+        self.assertEqual(self.flags(), (True, True))
+        self.assertEqual(
+            self.cached(membership.FAVORITES), {self.recipe_id}
+        )
+
+        self.client.delete(f'/api/recipes/{self.recipe_id}/favorite/')
+        self.client.delete(f'/api/recipes/{self.recipe_id}/shopping_cart/')
+        self.assertEqual(self.flags(), (False, False))
+        self.assertEqual(self.cached(membership.CART), frozenset())
+
+    def test_stale_load_not_served(self):
+        versions = membership.get_versions(self.user.id)
+        stale = membership.load(self.user.id, membership.FAVORITES)
+        self.client.post(f'/api/recipes/{self.recipe_id}/favorite/')
+        # параллельный запрос кладет в кэш множество, загруженное из БД
+        # до записи
+        cache.set(
+            membership.cache_key(
+                self.user.id, membership.FAVORITES,
+                versions[membership.FAVORITES]
+            ),
+            stale
+        )
+        self.assertEqual(self.flags(), (True, False))
+
+    def test_recipe_delete(self):
+        self.client.post(f'/api/recipes/{self.recipe_id}/favorite/')
+        self.client.post(f'/api/recipes/{self.recipe_id}/shopping_cart/')
+        Recipe.objects.get(pk=self.recipe_id).delete()
+        response = self.client.get('/api/recipes/?is_favorited=1')
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(self.cached(membership.FAVORITES), frozenset())
+        self.assertEqual(self.cached(membership.CART), frozenset())
+
+    def test_filters_use_cache(self):
+        self.client.post(f'/api/recipes/{self.recipe_id}/favorite/')
+        # COUNT, рецепты, ингредиенты, теги и варианты фильтра tags
+        with max_queries(self, 5) as context:
+            response = self.client.get('/api/recipes/?is_favorited=1')
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [self.recipe_id]
+        )
+        self.assertFalse(any(
+            'recipes_favorited' in query['sql']
+            for query in context.captured_queries
+        ))
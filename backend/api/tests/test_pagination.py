@@ -0,0 +1,122 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .utils import (FoodgramTestCase, create_user, max_queries, seed,
+                    seed_activity)
+from api.paginations import MAX_PAGE_SIZE
+from recipes import membership
+from recipes.models import Recipe
+
+
+class CursorPaginationTests(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=MAX_PAGE_SIZE + 20, authors=6)
+        cls.user = create_user('reader')
+        seed_activity(cls.user, cls.data, follows=6)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        # множества избранного и корзины уже в кэше
+        membership.get_recipe_ids(self.user)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_recipes_cursor_matches_page_order(self):
+        page = self.client.get('/api/recipes/?limit=1000')
+        expected = [item['id'] for item in page.data['results']]
+        self.assertEqual(len(expected), MAX_PAGE_SIZE)
+
+        ids = self.walk('/api/recipes/?cursor=&limit=7')
+        self.assertEqual(len(ids), len(self.data['recipe_ids']))
+        self.assertEqual(ids[:MAX_PAGE_SIZE], expected)
+
+    def test_recipes_cursor_skips_count(self):
+        with max_queries(self, 4) as context:
+            self.client.get('/api/recipes/?cursor=')
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in context.captured_queries
+        ))
+
+    def test_subscriptions_cursor(self):
+        ids = self.walk('/api/users/subscriptions/?cursor=&limit=4')
+        expected = [author.id for author in reversed(self.data['authors'])]
+        self.assertEqual(ids, expected)
+
+    def test_page_number_contract(self):
+        response = self.client.get('/api/recipes/?page=2&limit=6')
+        self.assertEqual(response.data['count'], len(self.data['recipe_ids']))
+        self.assertEqual(len(response.data['results']), 6)
+
+
+class CountModeTests(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=12, authors=3)
+        cls.user = create_user('reader')
+        seed_activity(cls.user, cls.data)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        counts = [
+            query for query in context.captured_queries
+            if 'COUNT(' in query['sql']
+        ]
+        return response, len(counts)
+
+    def test_exact(self):
+        response, counts = self.count_queries('/api/recipes/')
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(response.data['count_mode'], 'exact')
+        self.assertEqual(counts, 1)
+
+    @override_settings(PAGINATION_COUNT_MODE='cached')
+    def test_cached_invalidated_on_create_and_delete(self):
+        url = '/api/recipes/?tags=tag0'
+        expected = Recipe.objects.filter(tags__slug='tag0').count()
+        response, counts = self.count_queries(url)
+        self.assertEqual(counts, 1)
+        response, counts = self.count_queries(url)
+        self.assertEqual(response.data['count'], expected)
+        self.assertEqual(response.data['count_mode'], 'cached')
+        self.assertEqual(counts, 0)
+
+        recipe = Recipe.objects.create(
+            author=self.user, name='Новый', text='Текст', cooking_time=1
+        )
+        recipe.tags.set(self.data['tags'][:1])
+        response, counts = self.count_queries(url)
+        self.assertEqual(response.data['count'], expected + 1)
+        self.assertEqual(counts, 1)
+
+        recipe.delete()
+        response, _ = self.count_queries(url)
+        self.assertEqual(response.data['count'], expected)
+
+    @override_settings(PAGINATION_COUNT_MODE='cached')
+    def test_cached_personal_filters_are_exact(self):
+        response, _ = self.count_queries('/api/recipes/?is_favorited=1')
+        self.assertEqual(response.data['count_mode'], 'exact')
+
+    @override_settings(PAGINATION_COUNT_MODE='estimated')
+    def test_estimated_small_result_is_exact(self):
+        response, _ = self.count_queries('/api/recipes/')
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(response.data['count_mode'], 'exact')
@@ -0,0 +1,141 @@
+import datetime as dt
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+
+from .utils import FoodgramTestCase, create_user, seed
+from recipes import popularity
+from recipes.models import Favorited, Recipe, ShoppingCart
+
+
+class PopularityTests(FoodgramTestCase):
+
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=30, authors=3, tags=3)
+        cls.user = create_user('reader')
+        ids = cls.data['recipe_ids']
+        fans = [create_user(f'fan{i}') for i in range(4)]
+        for number, fan in enumerate(fans):
+            for recipe_id in ids[:number + 1]:
+                Favorited.objects.create(user=fan, recipe_id=recipe_id)
+            ShoppingCart.objects.create(user=fan, recipe_id=ids[5])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def expected(self, **filters):
+        return list(Recipe.objects.filter(**filters).distinct().order_by(
+            *popularity.ORDERING
+        ).values_list('id', flat=True))
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            ids.extend(self.ids(response))
+            url = response.data['next']
+        return ids
+
+    def test_events_update_score(self):
+        self.assertEqual(popularity.rebuild_popularity(fix=False), [])
+        recipe_id = self.data['recipe_ids'][-1]
+        self.client.post(f'{self.url}{recipe_id}/favorite/')
+        self.client.post(f'{self.url}{recipe_id}/shopping_cart/')
+        recipe = Recipe.objects.get(pk=recipe_id)
+        self.assertEqual(
+            (recipe.favorites_count, recipe.carts_count), (1, 1)
+        )
+        self.assertAlmostEqual(recipe.popularity, popularity.score(
+            recipe.pub_date, 1, 1
+        ))
+        self.client.delete(f'{self.url}{recipe_id}/favorite/')
+        self.client.delete(f'{self.url}{recipe_id}/shopping_cart/')
+        self.assertEqual(popularity.rebuild_popularity(fix=False), [])
+
+    def test_change_below_zero(self):
+        recipe = Recipe.objects.get(pk=self.data['recipe_ids'][-1])
+        popularity.change(recipe.pk, favorites=-1, carts=-1)
+        changed = Recipe.objects.get(pk=recipe.pk)
+        self.assertEqual(
+            (changed.favorites_count, changed.carts_count), (0, 0)
+        )
+        self.assertAlmostEqual(changed.popularity, recipe.popularity)
+
+    def test_ordering_popular(self):
+        ids = self.data['recipe_ids']
+        response = self.client.get(self.url, {'ordering': 'popular'})
+        self.assertEqual(self.ids(response)[:3], [ids[5], ids[0], ids[1]])
+        self.assertEqual(
+            self.walk(f'{self.url}?ordering=popular&limit=7'),
+            self.expected()
+        )
+
+    def test_ordering_popular_with_tags(self):
+        url = f'{self.url}?ordering=popular&tags=tag0&tags=tag1&limit=4'
+        self.assertEqual(
+            self.walk(url), self.expected(tags__slug__in=['tag0', 'tag1'])
+        )
+        self.assertEqual(
+            self.walk(url + '&cursor='),
+            self.expected(tags__slug__in=['tag0', 'tag1'])
+        )
+
+    def test_cursor_matches_pages(self):
+        self.assertEqual(
+            self.walk(f'{self.url}?ordering=popular&cursor=&limit=6'),
+            self.expected()
+        )
+
+    def test_internal_fields_hidden(self):
+        recipe_id = self.data['recipe_ids'][0]
+        recipes = [
+            self.client.get(self.url).data['results'][0],
+            self.client.get(f'{self.url}{recipe_id}/').data,
+        ]
+        for recipe in recipes:
+            for field in ('favorites_count', 'carts_count', 'popularity'):
+                self.assertNotIn(field, recipe)
+
+    def test_invalid_ordering(self):
+        response = self.client.get(self.url, {'ordering': 'name'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.data)
+
+    def test_decay(self):
+        pub_date = dt.datetime(2023, 1, 1, tzinfo=dt.timezone.utc)
+        with override_settings(POPULARITY_HALF_LIFE_DAYS=7):
+            # вдвое больший вес уравновешивает неделю разницы в возрасте
+            self.assertAlmostEqual(
+                popularity.score(pub_date, 3, 0),
+                popularity.score(pub_date + dt.timedelta(days=7), 1, 0)
+            )
+
+    def test_index_scan(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('план запроса SQLite')
+        queryset = Recipe.objects.order_by(*popularity.ORDERING)[:10]
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('recipe_popularity_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_rebuild_popularity(self):
+        recipe_id = self.data['recipe_ids'][0]
+        Recipe.objects.filter(pk=recipe_id).update(popularity=0)
+        output = StringIO()
+        call_command('rebuild_popularity', '--check', stdout=output)
+        self.assertIn(f'popularity id={recipe_id}', output.getvalue())
+        call_command('rebuild_popularity', stdout=StringIO())
+        self.assertEqual(popularity.rebuild_popularity(fix=False), [])
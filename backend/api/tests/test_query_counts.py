@@ -0,0 +1,218 @@
+import shutil
+import tempfile
+
+from django.test import override_settings
+
+from .utils import (PNG_BASE64, FoodgramTestCase, create_user, max_queries,
+                    seed, seed_activity)
+from recipes import membership
+from recipes.models import Recipe
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryCountTests(FoodgramTestCase):
+    '''Верхние границы числа запросов к БД для эндпоинтов api/urls.py.
+
+    Границы не должны зависеть от размера страницы: возврат N+1
+    в RecipeReadSerializer или SubscribersReadSerializer ломает тесты.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=30, authors=6, ingredients=40)
+        cls.user = create_user('reader')
+        seed_activity(cls.user, cls.data)
+        cls.recipe_id = cls.data['recipe_ids'][0]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        # множества избранного и корзины уже в кэше
+        membership.get_recipe_ids(self.user)
+
+    def recipe_payload(self, ingredients=10):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': PNG_BASE64,
+            'tags': [tag.id for tag in self.data['tags'][:2]],
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 5}
+                for ingredient_id in self.data['ingredient_ids'][:ingredients]
+            ],
+        }
+
+    def test_recipe_list(self):
+        for limit in (1, 5, 30):
+            # страница, COUNT и загрузка рецептов, которых нет в кэше
+            with self.subTest(limit=limit), max_queries(self, 5):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(response.status_code, 200)
+
+    def test_recipe_list_cached(self):
+        self.client.get('/api/recipes/?limit=30')
+        for limit in (1, 30):
+            with self.subTest(limit=limit), max_queries(self, 2):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(response.status_code, 200)
+
+    def test_recipe_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.client.get('/api/recipes/?limit=30')
+        for limit in (1, 30):
+            with self.subTest(limit=limit), max_queries(self, 2):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(response.status_code, 200)
+
+    def test_recipe_list_filters(self):
+        urls = (
+            '/api/recipes/?is_favorited=1',
+            '/api/recipes/?is_in_shopping_cart=1',
+            '/api/recipes/?tags=tag0&tags=tag1',
+            f'/api/recipes/?author={self.data["authors"][0].id}',
+        )
+        for url in urls:
+            with self.subTest(url=url), max_queries(self, 7):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_recipe_retrieve(self):
+        with max_queries(self, 4):
+            response = self.client.get(f'/api/recipes/{self.recipe_id}/')
+        self.assertEqual(response.status_code, 200)
+        with max_queries(self, 1):
+            response = self.client.get(f'/api/recipes/{self.recipe_id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipe_create(self):
+        for ingredients in (2, 20):
+            payload = self.recipe_payload(ingredients)
+            payload['name'] = f'Рецепт из {ingredients} ингредиентов'
+            with self.subTest(ingredients=ingredients), max_queries(self, 19):
+                response = self.client.post(
+                    '/api/recipes/', payload, format='json'
+                )
+                self.assertEqual(response.status_code, 201)
+
+    def test_recipe_patch(self):
+        recipe_id = self.client.post(
+            '/api/recipes/', self.recipe_payload(), format='json'
+        ).data['id']
+        payload = self.recipe_payload()
+        payload['cooking_time'] = 20
+        with max_queries(self, 15):
+            response = self.client.patch(
+                f'/api/recipes/{recipe_id}/', payload, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipe_delete(self):
+        recipe_id = self.client.post(
+            '/api/recipes/', self.recipe_payload(), format='json'
+        ).data['id']
+        with max_queries(self, 14):
+            response = self.client.delete(f'/api/recipes/{recipe_id}/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_favorite(self):
+        recipe_id = self.data['recipe_ids'][-1]
+        # включая перезагрузку множества избранного после смены версии
+        with max_queries(self, 10):
+            response = self.client.post(f'/api/recipes/{recipe_id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        # включая блокировку удаляемой строки
+        with max_queries(self, 4):
+            response = self.client.delete(
+                f'/api/recipes/{recipe_id}/favorite/'
+            )
+        self.assertEqual(response.status_code, 204)
+
+    def test_shopping_cart(self):
+        recipe_id = self.data['recipe_ids'][0]
+        # включая обновление сохраненного списка покупок
+        with max_queries(self, 11):
+            response = self.client.post(
+                f'/api/recipes/{recipe_id}/shopping_cart/'
+            )
+        self.assertEqual(response.status_code, 201)
+        with max_queries(self, 10):
+            response = self.client.delete(
+                f'/api/recipes/{recipe_id}/shopping_cart/'
+            )
+        self.assertEqual(response.status_code, 204)
+
+    def test_shopping_list(self):
+        with max_queries(self, 1):
+            response = self.client.get('/api/recipes/shopping_list/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data)
+
+    def test_download_shopping_cart(self):
+        with max_queries(self, 2):
+            response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_subscribe(self):
+        author = self.data['authors'][-1]
+        # плюс условный UPDATE feed_on_read при подписке и отписке
+        with max_queries(self, 11):
+            response = self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        with max_queries(self, 6):
+            response = self.client.delete(
+                f'/api/users/{author.id}/subscribe/'
+            )
+        self.assertEqual(response.status_code, 204)
+
+    def test_subscriptions(self):
+        with max_queries(self, 4):
+            response = self.client.get(
+                '/api/users/subscriptions/?recipes_limit=3'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_ingredients(self):
+        for url in ('/api/ingredients/', '/api/ingredients/?name=инг'):
+            self.client.get(url)
+            with self.subTest(url=url), max_queries(self, 1):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_tags(self):
+        self.client.get('/api/tags/')
+        with max_queries(self, 1):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipe_flags(self):
+        response = self.client.get('/api/recipes/?limit=30')
+        results = {item['id']: item for item in response.data['results']}
+        favorited = set(
+            Recipe.objects.filter(
+                recipes_fav__user=self.user
+            ).values_list('id', flat=True)
+        )
+        in_cart = set(
+            Recipe.objects.filter(
+                recipes_shop__user=self.user
+            ).values_list('id', flat=True)
+        )
+        followed = {author.id for author in self.data['authors'][:3]}
+        for recipe_id, item in results.items():
+            self.assertEqual(item['is_favorited'], recipe_id in favorited)
+            self.assertEqual(
+                item['is_in_shopping_cart'], recipe_id in in_cart
+            )
+            self.assertEqual(
+                item['author']['is_subscribed'],
+                item['author']['id'] in followed
+            )
+            self.assertEqual(len(item['ingredients']), 10)
@@ -0,0 +1,129 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import override_settings
+
+from .utils import PNG_BASE64, FoodgramTestCase, create_user, seed
+from recipes.models import Recipe
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeWriteTests(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=1, authors=1, ingredients=10)
+        cls.user = create_user('cook')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.ingredient_ids = self.data['ingredient_ids']
+
+    def payload(self, ingredients):
+        return {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': PNG_BASE64,
+            'tags': [self.data['tags'][0].id],
+            'ingredients': ingredients,
+        }
+
+    def test_duplicates_are_merged(self):
+        first, second = self.ingredient_ids[:2]
+        response = self.client.post('/api/recipes/', self.payload([
+            {'id': first, 'amount': 2},
+            {'id': second, 'amount': 1},
+            {'id': first, 'amount': 3},
+        ]), format='json')
+        self.assertEqual(response.status_code, 201)
+        amounts = {
+            item['id']: item['amount'] for item in response.data['ingredients']
+        }
+        self.assertEqual(amounts, {first: 5, second: 1})
+
+    def test_unknown_ingredients_reported_together(self):
+        response = self.client.post('/api/recipes/', self.payload([
+            {'id': self.ingredient_ids[0], 'amount': 1},
+            {'id': 100500, 'amount': 1},
+            {'id': 100501, 'amount': 1},
+        ]), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('100500, 100501', str(response.data))
+        self.assertFalse(Recipe.objects.filter(author=self.user).exists())
+
+    def test_update_changes_only_differing_rows(self):
+        first, second, third = self.ingredient_ids[:3]
+        recipe_id = self.client.post('/api/recipes/', self.payload([
+            {'id': first, 'amount': 1},
+            {'id': second, 'amount': 2},
+        ]), format='json').data['id']
+        recipe = Recipe.objects.get(id=recipe_id)
+        kept = recipe.recipe_ingredient.get(ingredient_id=first).id
+        changed = recipe.recipe_ingredient.get(ingredient_id=second).id
+
+        payload = self.payload([
+            {'id': first, 'amount': 1},
+            {'id': second, 'amount': 7},
+            {'id': third, 'amount': 3},
+        ])
+        response = self.client.patch(
+            f'/api/recipes/{recipe_id}/', payload, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        rows = {
+            row.ingredient_id: row
+            for row in recipe.recipe_ingredient.all()
+        }
+        self.assertEqual(rows[first].id, kept)
+        self.assertEqual(rows[second].id, changed)
+        self.assertEqual(rows[second].amount, 7)
+        self.assertEqual(rows[third].amount, 3)
+        amounts = {
+            item['id']: item['amount'] for item in response.data['ingredients']
+        }
+        self.assertEqual(amounts, {first: 1, second: 7, third: 3})
+
+        response = self.client.patch(
+            f'/api/recipes/{recipe_id}/',
+            self.payload([{'id': third, 'amount': 3}]),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(recipe.recipe_ingredient.values_list('id', flat=True)),
+            [rows[third].id]
+        )
+
+    def test_failed_update_is_rolled_back(self):
+        first, second = self.ingredient_ids[:2]
+        recipe_id = self.client.post('/api/recipes/', self.payload([
+            {'id': first, 'amount': 1},
+        ]), format='json').data['id']
+        recipe = Recipe.objects.get(id=recipe_id)
+
+        with mock.patch(
+            'api.serializers.RecipeIngredient.objects.bulk_create',
+            side_effect=DatabaseError
+        ), self.assertRaises(DatabaseError):
+            self.client.patch(
+                f'/api/recipes/{recipe_id}/',
+                self.payload([{'id': second, 'amount': 2}]),
+                format='json'
+            )
+        self.assertEqual(
+            list(recipe.recipe_ingredient.values_list(
+                'ingredient_id', flat=True
+            )),
+            [first]
+        )
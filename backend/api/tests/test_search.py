@@ -0,0 +1,172 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .utils import PNG_BASE64, FoodgramTestCase, create_user, max_queries
+from recipes import search
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class SearchTests(FoodgramTestCase):
+
+    url = '/api/recipes/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('cook')
+        cls.tag = Tag.objects.create(
+            name='Десерт', color='#FF0000', slug='dessert'
+        )
+        cls.flour = Ingredient.objects.create(
+            name='мука пшеничная', measurement_unit='г'
+        )
+        cls.cocoa = Ingredient.objects.create(
+            name='какао', measurement_unit='г'
+        )
+        cls.cake = cls.create_recipe(
+            'Торт шоколадный', 'Испечь коржи и пропитать', [cls.cocoa]
+        )
+        cls.pie = cls.create_recipe(
+            'Пирог с яблоками', 'Подавать вместо торта', [cls.flour]
+        )
+        cls.bread = cls.create_recipe(
+            'Хлеб', 'Замесить тесто', [cls.flour], tags=False
+        )
+        search.index()
+
+    @classmethod
+    def create_recipe(cls, name, text, ingredients, tags=True):
+        recipe = Recipe.objects.create(
+            author=cls.user, name=name, text=text,
+            image='recipes/seed.png', cooking_time=10
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        if tags:
+            recipe.tags.add(cls.tag)
+        return recipe
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def found(self, query, **params):
+        response = self.client.get(self.url, {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_name_ingredients_and_text(self):
+        self.assertEqual(self.found('шоколадный'), [self.cake.id])
+        self.assertEqual(self.found('какао'), [self.cake.id])
+        self.assertEqual(self.found('коржи'), [self.cake.id])
+        self.assertEqual(
+            set(self.found('мука')), {self.pie.id, self.bread.id}
+        )
+
+    def test_word_forms(self):
+        self.assertEqual(self.found('муки'), self.found('мука'))
+        self.assertEqual(self.found('яблоко'), [self.pie.id])
+
+    def test_all_words_required(self):
+        self.assertEqual(self.found('мука хлеб'), [self.bread.id])
+        self.assertEqual(self.found('какао хлеб'), [])
+
+    def test_name_ranks_above_text(self):
+        self.assertEqual(self.found('торт'), [self.cake.id, self.pie.id])
+
+    def test_with_tags_and_ordering(self):
+        self.assertEqual(
+            self.found('мука', tags='dessert'), [self.pie.id]
+        )
+        Recipe.objects.filter(pk=self.bread.pk).update(popularity=10 ** 6)
+        self.assertEqual(
+            self.found('мука', ordering='popular'),
+            [self.bread.id, self.pie.id]
+        )
+
+    def test_cursor(self):
+        first = self.client.get(
+            self.url, {'search': 'торт', 'cursor': '', 'limit': 1}
+        )
+        self.assertEqual(first.status_code, 200)
+        second = self.client.get(first.data['next'])
+        self.assertEqual(
+            [item['id'] for item in first.data['results']
+             + second.data['results']],
+            [self.cake.id, self.pie.id]
+        )
+
+    def test_no_words(self):
+        self.assertEqual(self.found('!!!'), [])
+
+    def test_index_follows_changes(self):
+        response = self.client.patch(f'{self.url}{self.bread.id}/', {
+            'name': 'Багет',
+            'text': 'Замесить тесто',
+            'cooking_time': 10,
+            'image': PNG_BASE64,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.cocoa.id, 'amount': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.found('хлеб'), [])
+        self.assertEqual(self.found('багет какао'), [self.bread.id])
+
+        self.cocoa.name = 'шоколад'
+        self.cocoa.save()
+        self.assertEqual(self.found('какао'), [])
+        self.assertEqual(
+            set(self.found('шоколад')), {self.cake.id, self.bread.id}
+        )
+
+        self.client.delete(f'{self.url}{self.cake.id}/')
+        self.assertEqual(self.found('шоколад'), [self.bread.id])
+
+    def test_created_recipe_is_indexed(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, {
+                'name': 'Блины',
+                'text': 'Жарить на сковороде',
+                'cooking_time': 10,
+                'image': PNG_BASE64,
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.flour.id, 'amount': 200}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        # индекс записывается один раз, после ингредиентов
+        self.assertEqual(len([
+            query for query in context.captured_queries
+            if 'recipes_recipe_fts' in query['sql']
+            or 'SET search_vector' in query['sql']
+        ]), 1)
+        self.assertEqual(
+            self.found('блины мука'), [response.data['id']]
+        )
+
+    def test_queries(self):
+        self.client.get(self.url, {'search': 'торт'})
+        with max_queries(self, 4):
+            self.found('торт')
+
+    def test_rebuild_search_index(self):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM recipes_recipe_fts')
+            self.assertEqual(self.found('торт'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.found('торт'), [self.cake.id, self.pie.id])
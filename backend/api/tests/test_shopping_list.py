@@ -0,0 +1,299 @@
+import json
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from reportlab.pdfbase import pdfmetrics
+
+from .utils import (PNG_BASE64, FoodgramTestCase, create_user, seed,
+                    seed_activity)
+from api.exports import stream_json
+from api.shopping_list import FONT_NAME, render_pdf
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem, Tag)
+from recipes.shopping import cart_totals, rebuild_shopping_lists, shopping_list
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class ShoppingListPdfTests(FoodgramTestCase):
+
+    def test_font_is_registered_on_startup(self):
+        self.assertIn(FONT_NAME, pdfmetrics.getRegisteredFontNames())
+
+    def test_long_list_is_paginated(self):
+        buffer = BytesIO()
+        lines = [f'ингредиент {i}, г: {i}' for i in range(100)]
+
+        pages = render_pdf(lines, 'user', buffer)
+
+        # 24 строки на странице
+        self.assertEqual(pages, 5)
+        self.assertIn(b'/Count 5', buffer.getvalue())
+
+    def test_download(self):
+        data = seed(recipes=5)
+        user = create_user('buyer')
+        seed_activity(user, data, cart=5)
+        self.client.force_authenticate(user)
+
+        with mock.patch.object(pdfmetrics, 'registerFont') as register:
+            response = self.client.get('/api/recipes/download_shopping_cart/')
+
+        self.assertEqual(response.status_code, 200)
+        register.assert_not_called()
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn(
+            'attachment; filename="shopping_list.pdf"',
+            response['Content-Disposition']
+        )
+        self.assertTrue(
+            b''.join(response.streaming_content).startswith(b'%PDF')
+        )
+
+
+class CartTestCase(FoodgramTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('buyer')
+        self.author = author = create_user('author')
+        self.ingredients = flour, milk, salt = [
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (('мука', 'г'), ('молоко', 'мл'), ('соль', 'г'))
+        ]
+        self.recipes = recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {i}', text='текст',
+                image='recipes/seed.png', cooking_time=10
+            )
+            for i in range(3)
+        ]
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipes[0], ingredient=flour, amount=200),
+            RecipeIngredient(recipe=recipes[0], ingredient=milk, amount=300),
+            RecipeIngredient(recipe=recipes[0], ingredient=salt, amount=5),
+            RecipeIngredient(recipe=recipes[1], ingredient=flour, amount=150),
+            RecipeIngredient(recipe=recipes[1], ingredient=salt, amount=2),
+            RecipeIngredient(recipe=recipes[2], ingredient=flour, amount=1000),
+        ])
+        for user, recipe in (
+            (self.user, recipes[0]),
+            (self.user, recipes[1]),
+            (author, recipes[2]),
+        ):
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+
+
+class CartTotalsTests(CartTestCase):
+
+    def test_totals(self):
+        self.assertEqual(list(cart_totals(self.user)), [
+            {'name': 'молоко', 'measurement_unit': 'мл', 'total': 300},
+            {'name': 'мука', 'measurement_unit': 'г', 'total': 350},
+            {'name': 'соль', 'measurement_unit': 'г', 'total': 7},
+        ])
+
+    def test_recipe_without_ingredients(self):
+        recipe = Recipe.objects.create(
+            author=self.user, name='Пустой', text='текст',
+            image='recipes/seed.png', cooking_time=1
+        )
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.assertEqual(
+            [row['name'] for row in cart_totals(self.user)],
+            ['молоко', 'мука', 'соль']
+        )
+
+    def test_empty_cart(self):
+        self.assertEqual(list(cart_totals(create_user('empty'))), [])
+
+    def test_download_lines(self):
+        self.client.force_authenticate(self.user)
+        with mock.patch('api.views.render_pdf', wraps=render_pdf) as render:
+            response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(render.call_args[0][0], [
+            'молоко, мл: 300', 'мука, г: 350', 'соль, г: 7'
+        ])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ShoppingListTests(CartTestCase):
+    '''Сохраненный список покупок совпадает с агрегацией корзины.'''
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def assert_in_sync(self, user, expected):
+        self.assertEqual(
+            [
+                (row['name'], row['total'])
+                for row in shopping_list(user)
+            ],
+            expected
+        )
+        self.assertEqual(
+            list(shopping_list(user)), list(cart_totals(user))
+        )
+
+    def test_filled_by_cart_signals(self):
+        self.assert_in_sync(
+            self.user, [('молоко', 300), ('мука', 350), ('соль', 7)]
+        )
+        self.assert_in_sync(self.author, [('мука', 1000)])
+
+    def test_cart_add_and_remove(self):
+        self.client.force_authenticate(self.user)
+        recipe = self.recipes[2]
+
+        response = self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 201)
+        self.assert_in_sync(
+            self.user, [('молоко', 300), ('мука', 1350), ('соль', 7)]
+        )
+
+        for recipe in self.recipes[:2]:
+            response = self.client.delete(
+                f'/api/recipes/{recipe.id}/shopping_cart/'
+            )
+            self.assertEqual(response.status_code, 204)
+        self.assert_in_sync(self.user, [('мука', 1000)])
+        self.assertEqual(
+            ShoppingListItem.objects.filter(user=self.user).count(), 1
+        )
+
+    def test_recipe_edit_refreshes_carts(self):
+        flour, milk, salt = self.ingredients
+        recipe = self.recipes[0]
+        self.client.force_authenticate(self.author)
+
+        response = self.client.patch(f'/api/recipes/{recipe.id}/', {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'image': PNG_BASE64,
+            'tags': [Tag.objects.create(
+                name='Тег', color='#000000', slug='tag'
+            ).id],
+            'ingredients': [
+                {'id': flour.id, 'amount': 100},
+                {'id': milk.id, 'amount': 300},
+            ],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assert_in_sync(
+            self.user, [('молоко', 300), ('мука', 250), ('соль', 2)]
+        )
+
+    def test_recipe_delete_refreshes_carts(self):
+        self.recipes[0].delete()
+        self.assert_in_sync(self.user, [('мука', 150), ('соль', 2)])
+
+    def test_rebuild_command(self):
+        ShoppingListItem.objects.filter(user=self.user).update(amount=1)
+        ShoppingListItem.objects.filter(user=self.author).delete()
+
+        out = StringIO()
+        call_command('rebuild_shopping_lists', check=True, stdout=out)
+        self.assertIn('Расхождений: 4', out.getvalue())
+        self.assertEqual(
+            ShoppingListItem.objects.filter(user=self.author).count(), 0
+        )
+
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assert_in_sync(
+            self.user, [('молоко', 300), ('мука', 350), ('соль', 7)]
+        )
+        self.assert_in_sync(self.author, [('мука', 1000)])
+        self.assertEqual(rebuild_shopping_lists(fix=False), [])
+
+    def test_json_endpoint(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/recipes/shopping_list/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'name': 'молоко', 'measurement_unit': 'мл', 'amount': 300},
+            {'name': 'мука', 'measurement_unit': 'г', 'amount': 350},
+            {'name': 'соль', 'measurement_unit': 'г', 'amount': 7},
+        ])
+
+
+class ExportFormatTests(CartTestCase):
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def download(self, **kwargs):
+        with mock.patch('api.views.render_pdf', wraps=render_pdf) as render:
+            response = self.client.get(self.url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Accept', response['Vary'])
+        content = b''.join(response.streaming_content)
+        if response['Content-Type'] == 'application/pdf':
+            render.assert_called_once()
+            return response, content
+        render.assert_not_called()
+        return response, content.decode()
+
+    def test_pdf_is_default(self):
+        for accept in (None, '*/*', 'text/html,*/*;q=0.8'):
+            kwargs = {'HTTP_ACCEPT': accept} if accept else {}
+            response, content = self.download(**kwargs)
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_text(self):
+        response, content = self.download(data={'format': 'txt'})
+        self.assertEqual(
+            response['Content-Type'], 'text/plain; charset=utf-8'
+        )
+        self.assertIn('shopping_list.txt', response['Content-Disposition'])
+        self.assertEqual(
+            content, 'молоко, мл: 300\nмука, г: 350\nсоль, г: 7\n'
+        )
+
+    def test_csv(self):
+        response, content = self.download(HTTP_ACCEPT='text/csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(content.splitlines(), [
+            'name,measurement_unit,amount',
+            'молоко,мл,300',
+            'мука,г,350',
+            'соль,г,7',
+        ])
+
+    def test_json(self):
+        response, content = self.download(data={'format': 'json'})
+        self.assertEqual(
+            json.loads(content),
+            self.client.get('/api/recipes/shopping_list/').json()
+        )
+
+    def test_json_empty_and_chunked(self):
+        self.client.force_authenticate(create_user('empty'))
+        response, content = self.download(HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(content), [])
+
+        rows = [
+            {'name': f'ингредиент {i}', 'measurement_unit': 'г', 'total': i}
+            for i in range(1200)
+        ]
+        self.assertEqual(len(json.loads(''.join(stream_json(rows)))), 1200)
+
+    def test_errors_are_json(self):
+        response = self.client.get(self.url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+        self.client.force_authenticate(None)
+        response = self.client.get(self.url, {'format': 'csv'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
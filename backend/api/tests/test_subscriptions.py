@@ -0,0 +1,85 @@
+from .utils import FoodgramTestCase, create_user, max_queries, seed
+from recipes.models import Follow, Recipe
+
+
+class SubscriptionsTests(FoodgramTestCase):
+
+    url = '/api/users/subscriptions/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(recipes=40, authors=8)
+        cls.user = create_user('reader')
+        Follow.objects.bulk_create(
+            Follow(user=cls.user, author=author)
+            for author in cls.data['authors']
+        )
+        # обратная подписка: is_subscribed показывает ее
+        Follow.objects.create(user=cls.data['authors'][0], author=cls.user)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def latest(self, author, limit=None):
+        return list(
+            Recipe.objects.filter(author=author).values_list('id', flat=True)
+        )[:limit]
+
+    def test_recipes_limit(self):
+        response = self.client.get(
+            self.url, {'recipes_limit': 2, 'limit': 100}
+        )
+        self.assertEqual(response.status_code, 200)
+        authors = {author.id: author for author in self.data['authors']}
+        self.assertEqual(len(response.data['results']), len(authors))
+        for item in response.data['results']:
+            author = authors[item['id']]
+            self.assertEqual(
+                [recipe['id'] for recipe in item['recipes']],
+                self.latest(author, 2)
+            )
+            self.assertEqual(item['recipes_count'], 5)
+            self.assertEqual(
+                item['is_subscribed'], author == self.data['authors'][0]
+            )
+
+    def test_without_limit(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        for item in response.data['results']:
+            self.assertEqual(len(item['recipes']), 5)
+
+    def test_queries_do_not_depend_on_page_size(self):
+        for limit in (1, 8):
+            with self.subTest(limit=limit), max_queries(self, 4):
+                response = self.client.get(
+                    self.url, {'recipes_limit': 3, 'limit': limit}
+                )
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_invalid_recipes_limit(self):
+        for value in ('abc', '-1', '1.5'):
+            with self.subTest(value=value):
+                response = self.client.get(
+                    self.url, {'recipes_limit': value}
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('recipes_limit', response.data)
+
+    def test_subscribe_uses_limit(self):
+        author = create_user('new_author')
+        for i in range(3):
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {i}', text='текст',
+                image='recipes/seed.png', cooking_time=1
+            )
+        response = self.client.post(
+            f'/api/users/{author.id}/subscribe/?recipes_limit=1'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['recipes']],
+            self.latest(author, 1)
+        )
+        self.assertFalse(response.data['is_subscribed'])
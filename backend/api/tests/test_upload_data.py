@@ -0,0 +1,88 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+
+from .utils import FoodgramTestCase, max_queries
+from recipes.loaders import bulk_create_ingredients
+from recipes.models import Ingredient, Tag
+from recipes.versions import INGREDIENTS, get_version
+
+
+class UploadDataTests(FoodgramTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def upload(self, path, **options):
+        out = StringIO()
+        call_command('upload_data', path=path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_csv_is_deduplicated_and_idempotent(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        path = self.write('ingredients.csv', (
+            'соль,г\n'
+            'сахар,г\n'
+            ' сахар , г\n'
+            'сахар,кг\n'
+            '\n'
+        ))
+        version = get_version(INGREDIENTS)
+
+        output = self.upload(path)
+
+        self.assertIn('добавлено 2, пропущено 2', output)
+        self.assertEqual(
+            set(Ingredient.objects.values_list('name', 'measurement_unit')),
+            {('соль', 'г'), ('сахар', 'г'), ('сахар', 'кг')}
+        )
+        self.assertNotEqual(get_version(INGREDIENTS), version)
+        self.assertEqual(Tag.objects.count(), 4)
+
+        output = self.upload(path)
+        self.assertIn('добавлено 0, пропущено 4', output)
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_rows_skipped_by_conflict_not_counted(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        rows = [('соль', 'г'), ('сахар', 'г')]
+        # соль добавлена другим процессом после снимка существующих
+        with mock.patch.object(
+            Ingredient.objects, 'values_list', return_value=[]
+        ):
+            self.assertEqual(bulk_create_ingredients(rows, 100), (1, 1))
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+    def test_json_and_ndjson(self):
+        items = [
+            {'name': f'ингредиент {i}', 'measurement_unit': 'г'}
+            for i in range(5)
+        ]
+        self.upload(self.write('ingredients.json', json.dumps(items)))
+        self.upload(self.write('ingredients.ndjson', '\n'.join(
+            json.dumps(item) for item in items + [
+                {'name': 'мука', 'measurement_unit': 'кг'}
+            ]
+        )))
+        self.assertEqual(Ingredient.objects.count(), 6)
+
+    def test_queries_do_not_depend_on_row_count(self):
+        path = self.write('ingredients.csv', ''.join(
+            f'ингредиент {i},г\n' for i in range(2500)
+        ))
+        with max_queries(self, 34):
+            self.upload(path)
+        self.assertEqual(Ingredient.objects.count(), 2500)
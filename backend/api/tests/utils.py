@@ -0,0 +1,154 @@
+import base64
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from recipes import search, versions
+from recipes.counters import rebuild_counters
+from recipes.feed import rebuild_feeds
+from recipes.models import (Favorited, Follow, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag, TagRecipe)
+from recipes.popularity import rebuild_popularity
+from recipes.shopping import rebuild_shopping_lists
+from recipes.versions import INGREDIENTS, RECIPES, bump_version
+from users.models import CustomUser
+
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDw'
+    'ADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+PNG_BASE64 = 'data:image/png;base64,' + base64.b64encode(PNG).decode()
+
+BATCH_SIZE = 10000
+
+
+class FoodgramTestCase(APITestCase):
+    '''Базовый тест: кэш и запомненные в процессе версии справочников
+    не откатываются вместе с транзакцией, поэтому очищаются перед каждым
+    тестом.
+    '''
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        versions.local_versions.clear()
+
+
+def create_user(username):
+    return CustomUser.objects.create_user(
+        username=username,
+        email=f'{username}@foodgram.ru',
+        password='password',
+        first_name=username,
+        last_name=username,
+    )
+
+
+def seed(recipes=20, authors=5, ingredients=50, ingredients_per_recipe=10,
+         tags=3):
+    '''Заполнение БД набором данных, близким к рабочему.
+
+    Рецепты, ингредиенты и связи создаются через bulk_create,
+    поэтому функция пригодна и для 100k рецептов.
+    Возвращает словарь с созданными объектами.
+    '''
+    users = [create_user(f'author{i}') for i in range(authors)]
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {i}', color=f'#{i:06x}', slug=f'tag{i}')
+        for i in range(tags)
+    )
+    Ingredient.objects.bulk_create(
+        (
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(ingredients)
+        )
+    )
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    tag_objs = list(Tag.objects.all())
+
+    for start in range(0, recipes, BATCH_SIZE):
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=users[i % authors],
+                name=f'Рецепт {i}',
+                text='Описание рецепта',
+                image='recipes/seed.png',
+                cooking_time=i % 120 + 1,
+            )
+            for i in range(start, min(start + BATCH_SIZE, recipes))
+        )
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+
+    links = []
+    tag_links = []
+    for number, recipe_id in enumerate(recipe_ids):
+        for shift in range(ingredients_per_recipe):
+            links.append(RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_ids[
+                    (number + shift) % len(ingredient_ids)
+                ],
+                amount=shift + 1,
+            ))
+        tag_links.append(TagRecipe(
+            recipe_id=recipe_id,
+            tag=tag_objs[number % len(tag_objs)]
+        ))
+    RecipeIngredient.objects.bulk_create(links)
+    TagRecipe.objects.bulk_create(tag_links)
+    search.index()
+    # статистика для планировщика, как после autovacuum в PostgreSQL:
+    # без нее SQLite не выбирает индексы сортировки при фильтре по тегам
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    rebuild_counters()
+    # bulk_create не отправляет сигналы
+    bump_version(INGREDIENTS)
+    bump_version(RECIPES)
+
+    return {
+        'authors': users,
+        'tags': tag_objs,
+        'ingredient_ids': ingredient_ids,
+        'recipe_ids': recipe_ids,
+    }
+
+
+def seed_activity(user, data, favorites=5, cart=5, follows=3):
+    '''Избранное, список покупок и подписки пользователя user.'''
+
+    recipe_ids = data['recipe_ids']
+    Favorited.objects.bulk_create(
+        Favorited(user=user, recipe_id=recipe_id)
+        for recipe_id in recipe_ids[:favorites]
+    )
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=user, recipe_id=recipe_id)
+        for recipe_id in recipe_ids[-cart:]
+    )
+    Follow.objects.bulk_create(
+        Follow(user=user, author=author)
+        for author in data['authors'][:follows]
+    )
+    # bulk_create не отправляет сигналы
+    rebuild_counters()
+    rebuild_popularity()
+    rebuild_shopping_lists()
+    rebuild_feeds()
+
+
+@contextmanager
+def max_queries(testcase, limit):
+    '''Аналог assertNumQueries, проверяющий верхнюю границу.'''
+
+    with CaptureQueriesContext(connection) as context:
+        yield context
+    executed = len(context)
+    testcase.assertLessEqual(
+        executed, limit,
+        f'{executed} запросов к БД при допустимых {limit}:\n'
+        + '\n'.join(query['sql'] for query in context.captured_queries)
+    )
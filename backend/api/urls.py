@@ -37,6 +37,16 @@ urlpatterns = [
         views.DownloadShoppingCartView.as_view(),
         name='shopping_cart'
     ),
+    path(
+        'recipes/shopping_list/',
+        views.ShoppingListView.as_view(),
+        name='shopping_list'
+    ),
+    path(
+        'recipes/import/',
+        views.RecipeImportView.as_view(),
+        name='recipes_import'
+    ),
     path(
         'recipes/<int:id>/shopping_cart/',
         views.ShoppingCartView.as_view(),
@@ -1,31 +1,40 @@
 from io import BytesIO
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http.response import HttpResponse
+from django.db.models import Exists, F, OuterRef
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework.backends import DjangoFilterBackend
 from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from djoser import utils
 from djoser.conf import settings as djoser_settings
 from djoser.views import TokenCreateView
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 
+from .exports import (STREAMS, CSVRenderer, PDFRenderer, PlainTextRenderer,
+                      format_line)
 from .filters import IngredientFilter, RecipeFilter
-from .paginations import CustomPaginator
+from .importer import RecipeImporter
+from .ingredients_index import ingredient_index
+from .mixins import BodySizeLimitMixin, CatalogCacheMixin
+from .paginations import CACHED, EXACT, CustomCursorPaginator, CustomPaginator
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (FavoritedSerializer, FollowSerializer,
                           IngredientSerializer, RecipeReadSerializer,
                           RecipeWriteSerializer, ShoppingCartSerializer,
-                          SubscribersReadSerializer, TagSerializer)
-from backend.settings import FONT_PATH
+                          ShoppingListSerializer, SubscribersReadSerializer,
+                          TagSerializer)
+from .shopping_list import render_pdf
+from recipes import feed
 from recipes.models import (Favorited, Follow, Ingredient, Recipe,
                             ShoppingCart, Tag)
+from recipes.shopping import shopping_list
+from recipes.versions import INGREDIENTS, TAGS
 
 User = get_user_model()
 
@@ -42,7 +51,8 @@ class CustomTokenCreateView(TokenCreateView):
         )
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
+    catalog_versions = (INGREDIENTS,)
     permission_classes = (
         permissions.IsAuthenticatedOrReadOnly,
         IsAuthorOrReadOnly
@@ -52,14 +62,31 @@ class IngredientViewSet(viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
 
-
-class TagViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        '''Поиск по началу названия обслуживается индексом в памяти,
+        без запросов к БД.
+        '''
+        if not request.query_params.get('name'):
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(request, self.search)
+
+    def search(self, request):
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit and limit.isdigit() else None
+        return Response(ingredient_index.search(
+            request.query_params['name'], limit,
+            version=self.get_catalog_versions()[INGREDIENTS]
+        ))
+
+
+class TagViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
+    catalog_versions = (TAGS,)
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(BodySizeLimitMixin, viewsets.ModelViewSet):
     permission_classes = (
         permissions.IsAuthenticatedOrReadOnly,
         IsAuthorOrReadOnly
@@ -70,6 +97,30 @@ class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeReadSerializer
     http_method_names = ['get', 'post', 'put', 'patch', 'delete']
+    cursor_ordering = ('-pub_date', '-id')
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            return Recipe.objects.for_list(self.request.user)
+        return Recipe.objects.all()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        # курсор строится по порядку, выбранному в ?ordering=
+        if queryset.query.order_by:
+            self.cursor_ordering = tuple(queryset.query.order_by)
+        return queryset
+
+    def get_count_mode(self):
+        # Кэш count сбрасывается только при создании/удалении рецептов,
+        # поэтому для выборок по избранному и корзине считаем точно.
+        mode = settings.PAGINATION_COUNT_MODE
+        personal = ('is_favorited', 'is_in_shopping_cart')
+        if mode == CACHED and any(
+            param in self.request.query_params for param in personal
+        ):
+            return EXACT
+        return mode
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -79,6 +130,53 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    @action(
+        detail=False,
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def feed(self, request):
+        '''Новые рецепты авторов из подписок, только keyset-пагинация.'''
+
+        self.cursor_ordering = feed.ORDERING
+        paginator = CustomCursorPaginator()
+        page = paginator.paginate_queryset(
+            feed.feed(request.user), request, view=self
+        )
+        serializer = RecipeReadSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+
+class RecipeImportView(APIView):
+    '''Импорт рецептов из NDJSON в теле запроса, только для администраторов.
+
+    Картинки берутся из settings.RECIPE_IMPORT_IMAGE_DIR, строки
+    без поля author создаются от имени текущего пользователя.
+    Параметр start_line продолжает прерванный импорт.
+    '''
+
+    permission_classes = (permissions.IsAdminUser,)
+
+    def post(self, request):
+        start_line = request.query_params.get('start_line', '0')
+        if not start_line.isdigit():
+            return Response({
+                'start_line': 'Значение должно быть целым числом >= 0.'
+            }, status=status.HTTP_400_BAD_REQUEST
+            )
+        errors = []
+        importer = RecipeImporter(
+            author=request.user,
+            report=lambda line, detail: errors.append(
+                {'line': line, 'errors': detail}
+            )
+        )
+        # тело читается построчно, без загрузки в память целиком
+        result = importer.run(request.stream or [], int(start_line))
+        result['errors'] = errors
+        return Response(result)
+
 
 class ShoppingCartView(APIView):
     def post(self, request, id):
@@ -141,52 +239,63 @@ class FavoritedView(APIView):
         )
 
 
-class DownloadShoppingCartView(APIView):
-
-    def get(self, request, path=FONT_PATH):
-        shopping_list = request.user.buyer.values(
-            'recipe__ingredients__name',
-            'recipe__ingredients__measurement_unit'
-        ).annotate(
-            sum=Sum('recipe__recipe_ingredient__amount')
-        )
-
-        print_list = []
-        for element in shopping_list:
-            ingredient = element.get('recipe__ingredients__name')
-            unit = element.get('recipe__ingredients__measurement_unit')
-            sum = element.get('sum')
-            total_ingredient = f'{ingredient}, {unit}: {sum}'
-
-            print_list.append(total_ingredient)
-
-        response = HttpResponse(content_type='application/pdf')
-        content_disposition = 'attachment; filename="shopping_list.pdf"'
-        response['Content-Disposition'] = content_disposition
-
-        buffer = BytesIO()
-        pdf = canvas.Canvas(buffer, A4)
+class ShoppingListView(APIView):
+    '''Сохраненный список покупок пользователя в JSON.'''
 
-        pdfmetrics.registerFont(TTFont('FreeSans', path))
-        pdf.setFont('FreeSans', 12)
+    def get(self, request):
+        return Response(ShoppingListSerializer(
+            shopping_list(request.user), many=True
+        ).data)
 
-        string_height = 750
 
-        pdf.drawString(50, 800, 'Список ингредиентов')
-        pdf.drawString(400, 800, f'Пользователь: {request.user.username}')
-        pdf.line(0, 790, 800, 790)
-
-        for line in print_list:
-            pdf.drawString(50, string_height, line)
-            string_height -= 30
+class DownloadShoppingCartView(APIView):
+    '''Выгрузка списка покупок: PDF по умолчанию, текст, CSV и JSON
+    по ?format= (pdf, txt, csv, json) или заголовку Accept.
 
-        pdf.showPage()
-        pdf.save()
+    Текстовые форматы отдаются потоком и не используют ReportLab.
+    '''
 
-        pdf = buffer.getvalue()
-        buffer.close()
-        response.write(pdf)
+    renderer_classes = (
+        PDFRenderer, PlainTextRenderer, CSVRenderer, JSONRenderer
+    )
 
+    def handle_exception(self, exc):
+        # ошибки отдаются в JSON при любом запрошенном формате
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
+
+    def get(self, request):
+        renderer = request.accepted_renderer
+        rows = shopping_list(request.user)
+        if renderer.format in STREAMS:
+            stream, attachment = STREAMS[renderer.format]
+            response = StreamingHttpResponse(
+                stream(rows.iterator()),
+                content_type=f'{renderer.media_type}; charset=utf-8'
+            )
+            if attachment:
+                response['Content-Disposition'] = (
+                    'attachment; '
+                    f'filename="shopping_list.{renderer.format}"'
+                )
+        else:
+            # canvas пишет PDF прямо в буфер, FileResponse отдает его
+            # частями без промежуточных копий
+            buffer = BytesIO()
+            render_pdf(
+                [format_line(row) for row in rows],
+                request.user.username,
+                buffer
+            )
+            buffer.seek(0)
+            response = FileResponse(
+                buffer,
+                as_attachment=True,
+                filename='shopping_list.pdf',
+                content_type='application/pdf'
+            )
+        patch_vary_headers(response, ('Accept',))
         return response
 
 
@@ -231,9 +340,21 @@ class SubscriptionsViewSet(viewsets.ModelViewSet):
     pagination_class = CustomPaginator
     serializer_class = SubscribersReadSerializer
     http_method_names = ['get']
+    # сначала авторы, на которых подписались последними
+    cursor_ordering = ('-follow_id',)
+
+    def get_count_mode(self):
+        return EXACT
 
     def get_queryset(self):
+        # is_subscribed сохраняет прежний смысл:
+        # подписан ли автор на текущего пользователя
         new_queryset = User.objects.filter(
             following__user=self.request.user
-        )
+        ).annotate(
+            follow_id=F('following__id'),
+            is_subscribed=Exists(Follow.objects.filter(
+                user=OuterRef('pk'), author=self.request.user
+            )),
+        ).order_by(*self.cursor_ordering)
         return new_queryset
@@ -126,6 +126,87 @@ DATABASES = {
     }
 }
 
+# В боевом окружении кэш должен быть общим для всех процессов
+# (memcached из infra/docker-compose.yml), см. recipes.checks.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', default=''),
+    }
+}
+
+# Способ подсчета поля count в ответах CustomPaginator:
+# exact - COUNT(*) на каждый запрос,
+# cached - COUNT(*) кэшируется по сигнатуре фильтра,
+# estimated - оценка планировщика PostgreSQL для больших выборок.
+PAGINATION_COUNT_MODE = os.environ.get(
+    'PAGINATION_COUNT_MODE',
+    default='exact'
+)
+PAGINATION_COUNT_CACHE_TIMEOUT = 60 * 5
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = 10000
+
+# Время жизни в кэше множеств id рецептов в избранном и списке покупок.
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 10
+
+# Время жизни в кэше общей для всех пользователей части рецепта.
+RECIPE_BODY_CACHE_TIMEOUT = 60 * 60
+
+# Сколько секунд процесс использует прочитанную из БД версию справочника
+# (ETag, индекс ингредиентов), не перечитывая ее.
+CATALOG_VERSION_TTL = 10
+
+# max-age для ответов справочников (теги, ингредиенты), после него
+# клиент и nginx перепроверяют данные по ETag.
+CATALOG_CACHE_MAX_AGE = 60
+
+# Импорт рецептов из NDJSON: каталог с картинками, на которые ссылаются
+# строки файла, и число строк, записываемых в одной транзакции.
+RECIPE_IMPORT_IMAGE_DIR = os.environ.get(
+    'RECIPE_IMPORT_IMAGE_DIR',
+    default=os.path.join(BASE_DIR, 'data', 'images')
+)
+RECIPE_IMPORT_BATCH_SIZE = 1000
+
+# Обработка картинок рецептов (команда process_images): ширина вариантов
+# (после изменения - process_images --enqueue-all), качество JPEG и WebP,
+# число попыток на задание и время, после которого зависшее задание
+# возвращается в очередь (секунды).
+IMAGE_VARIANT_WIDTHS = (200, 600, 1200)
+IMAGE_JPEG_QUALITY = 85
+IMAGE_WEBP_QUALITY = 80
+IMAGE_JOB_MAX_ATTEMPTS = 3
+IMAGE_JOB_TIMEOUT = 60 * 10
+
+# Ограничения загрузки картинок рецептов в base64: размер картинки (байт,
+# проверяется по длине base64 до декодирования) и тела запроса (по
+# Content-Length, до чтения), стороны и число пикселей (по заголовку
+# картинки). Декодированная картинка держится в памяти до
+# IMAGE_UPLOAD_SPOOL_SIZE байт, дальше - во временном файле.
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_MAX_BODY_SIZE = IMAGE_UPLOAD_MAX_SIZE * 4 // 3 + 256 * 1024
+IMAGE_MAX_DIMENSION = 10000
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+IMAGE_UPLOAD_SPOOL_SIZE = 1024 * 1024
+
+# Лента подписок: рецепты автора, у которого подписчиков стало больше
+# FEED_FANOUT_MAX_FOLLOWERS, перестают раскладываться по лентам при
+# публикации и добавляются при чтении, пока подписчиков не станет
+# FEED_FANOUT_RESUME_FOLLOWERS или меньше; при подписке в ленту переносятся
+# FEED_BACKFILL_SIZE последних рецептов автора.
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_FANOUT_RESUME_FOLLOWERS = 9000
+FEED_BACKFILL_SIZE = 100
+
+# Период полураспада популярности рецепта: рецепт, добавленный
+# в избранное и корзины вдвое чаще, ранжируется наравне с рецептом,
+# опубликованным на POPULARITY_HALF_LIFE_DAYS дней позже. После изменения
+# нужен python manage.py rebuild_popularity.
+POPULARITY_HALF_LIFE_DAYS = 7
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Follow, Ingredient, Recipe, Tag
+from . import search, shopping
+from .models import Follow, ImageJob, Ingredient, Recipe, Tag
 
 TAG_CHOICES = (
     ('breakfast', 'Завтрак'),
@@ -47,7 +48,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'image',
         'author',
         'cooking_time',
-        'favorited_count',
+        'favorites_count',
     )
     list_display_links = (
         'pk',
@@ -65,21 +66,28 @@ class RecipeAdmin(admin.ModelAdmin):
     sortable_by = (
         'name',
         'author',
-        'favorited_count',
+        'favorites_count',
     )
     fields = (
         'name',
-        'favorited_count',
+        'favorites_count',
         'image',
         'author',
         'text',
         'cooking_time',
     )
-    readonly_fields = ('favorited_count', )
+    readonly_fields = ('favorites_count', )
     autocomplete_fields = ('author', )
     inlines = (InlineIngredient, InlineTag, )
     raw_id_fields = ('author',)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # ингредиенты из инлайнов входят в поисковый индекс
+        search.index([form.instance.pk])
+        if change:
+            shopping.recipe_changed(form.instance.pk)
+
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
@@ -122,3 +130,20 @@ class FollowAdmin(admin.ModelAdmin):
         'user',
         'author',
     )
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'pk',
+        'recipe',
+        'source',
+        'status',
+        'attempts',
+        'updated',
+    )
+    list_filter = (
+        'status',
+    )
+    raw_id_fields = ('recipe',)
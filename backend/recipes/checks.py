@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def shared_cache(app_configs, **kwargs):
+    '''Версии, счетчики и фрагменты рецептов сбрасываются через кэш,
+    поэтому в боевом окружении он должен быть общим для процессов
+    gunicorn, image_worker и management-команд.
+    '''
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in LOCAL_CACHES:
+        return []
+    return [Error(
+        f'Кэш {backend} не общий для процессов.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION, например memcached '
+             'из infra/docker-compose.yml.',
+        id='recipes.E001',
+    )]
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Favorited, Follow, Recipe, ShoppingCart
+from users.models import CustomUser
+
+
+def count_subquery(queryset, field):
+    '''Подзапрос COUNT(*) по queryset, сгруппированному по field.'''
+
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorited.objects.all(), 'recipe'),
+    (Recipe, 'carts_count', ShoppingCart.objects.all(), 'recipe'),
+    (CustomUser, 'recipes_count', Recipe.objects.all(), 'author'),
+    (CustomUser, 'followers_count', Follow.objects.all(), 'author'),
+)
+
+
+def rebuild_counters(fix=True):
+    '''Пересчитывает денормализованные счетчики с нуля.
+
+    Возвращает словарь {поле: [(pk, сохранено, фактически), ...]}
+    с найденными расхождениями; при fix=True они исправляются.
+    '''
+    drift = {}
+    with transaction.atomic():
+        for model, field, queryset, related in COUNTERS:
+            actual = model.objects.annotate(
+                actual=count_subquery(queryset, related)
+            ).values_list('pk', field, 'actual')
+            drift[field] = [
+                (pk, stored, real) for pk, stored, real in actual
+                if stored != real
+            ]
+            if fix and drift[field]:
+                model.objects.update(
+                    **{field: count_subquery(queryset, related)}
+                )
+    return drift
@@ -0,0 +1,184 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import FeedEntry, Follow, Recipe
+from users.models import CustomUser
+
+# порядок ленты, по нему же строится курсор пагинации
+ORDERING = ('-feed_date', '-feed_recipe')
+
+BATCH_SIZE = 1000
+
+
+def fanout_authors():
+    '''Авторы, рецепты которых раскладываются по лентам при записи.'''
+
+    return CustomUser.objects.filter(feed_on_read=False)
+
+
+def create_entries(rows):
+    '''Записи ленты из (user_id, recipe_id, author_id, pub_date),
+    уже существующие пропускаются.
+    '''
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date
+            )
+            for user_id, recipe_id, author_id, pub_date in rows
+        ],
+        ignore_conflicts=True
+    )
+
+
+def publish(recipes):
+    '''Раскладывает новые рецепты по лентам подписчиков их авторов.'''
+
+    by_author = defaultdict(list)
+    for recipe in recipes:
+        if recipe.author_id is not None:
+            by_author[recipe.author_id].append(recipe)
+    if not by_author:
+        return
+    followers = Follow.objects.filter(
+        author__in=fanout_authors().filter(pk__in=by_author)
+    ).values_list('author_id', 'user_id')
+    create_entries(
+        (user_id, recipe.pk, author_id, recipe.pub_date)
+        for author_id, user_id in followers.iterator()
+        for recipe in by_author[author_id]
+    )
+
+
+def backfill(user_id, author_ids):
+    '''Переносит в ленту user_id последние settings.FEED_BACKFILL_SIZE
+    рецептов каждого из авторов author_ids.
+    '''
+    author_ids = list(fanout_authors().filter(
+        pk__in=author_ids
+    ).values_list('pk', flat=True))
+    if not author_ids:
+        return
+    create_entries(
+        (user_id, id, author_id, pub_date)
+        for id, author_id, pub_date in Recipe.objects.latest_by_authors(
+            author_ids, settings.FEED_BACKFILL_SIZE
+        ).values_list('id', 'author_id', 'pub_date').order_by()
+    )
+
+
+def backfill_followers(author_id):
+    '''Переносит последние рецепты автора author_id в ленты всех его
+    подписчиков; рецепты читаются один раз.
+    '''
+    recipes = list(Recipe.objects.latest_by_authors(
+        [author_id], settings.FEED_BACKFILL_SIZE
+    ).values_list('id', 'pub_date').order_by())
+    if not recipes:
+        return
+    user_ids = list(Follow.objects.filter(
+        author_id=author_id, user__isnull=False
+    ).values_list('user_id', flat=True))
+    rows = []
+    for user_id in user_ids:
+        rows.extend(
+            (user_id, id, author_id, pub_date) for id, pub_date in recipes
+        )
+        if len(rows) >= BATCH_SIZE:
+            create_entries(rows)
+            rows = []
+    create_entries(rows)
+
+
+def followers_changed(author_id, delta):
+    '''Переключает способ доставки рецептов автора после изменения
+    followers_count на delta.
+
+    Больше settings.FEED_FANOUT_MAX_FOLLOWERS подписчиков - рецепты
+    добавляются при чтении (feed_on_read). Обратно автор переключается,
+    когда подписчиков становится не больше
+    settings.FEED_FANOUT_RESUME_FOLLOWERS: разрыв между порогами не дает
+    одной подписке переключать его туда и обратно. При возврате ленты
+    подписчиков дополняются последними рецептами автора, иначе рецепты,
+    опубликованные без раскладки, пропали бы из лент.
+    '''
+    authors = CustomUser.objects.filter(pk=author_id)
+    if delta > 0:
+        authors.filter(
+            feed_on_read=False,
+            followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).update(feed_on_read=True)
+    elif authors.filter(
+        feed_on_read=True,
+        followers_count__lte=settings.FEED_FANOUT_RESUME_FOLLOWERS
+    ).update(feed_on_read=False):
+        backfill_followers(author_id)
+
+
+def trim(user_id, author_id):
+    '''Удаляет из ленты user_id рецепты автора author_id.'''
+
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def recipe_author_changed(recipe):
+    FeedEntry.objects.filter(recipe=recipe).delete()
+    publish([recipe])
+
+
+def rebuild_feeds(user_ids=None):
+    '''Пересобирает ленты пользователей user_ids (None - всех)
+    по подпискам, как при новой подписке на каждого автора.
+    При полной пересборке feed_on_read авторов сверяется
+    с followers_count. Возвращает число пересобранных лент.
+    '''
+    if user_ids is None:
+        CustomUser.objects.filter(
+            followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).update(feed_on_read=True)
+        CustomUser.objects.filter(
+            followers_count__lte=settings.FEED_FANOUT_RESUME_FOLLOWERS
+        ).update(feed_on_read=False)
+    follows = Follow.objects.filter(user__isnull=False, author__isnull=False)
+    if user_ids is not None:
+        follows = follows.filter(user_id__in=user_ids)
+    authors = defaultdict(list)
+    for user_id, author_id in follows.values_list('user_id', 'author_id'):
+        authors[user_id].append(author_id)
+    with transaction.atomic():
+        entries = FeedEntry.objects.all()
+        if user_ids is not None:
+            entries = entries.filter(user_id__in=user_ids)
+        entries.delete()
+        for user_id, author_ids in authors.items():
+            backfill(user_id, author_ids)
+    return len(authors)
+
+
+def feed(user):
+    '''Рецепты из подписок user в порядке ORDERING.
+
+    Обычно это один проход по индексу feed_user_pub_date_idx;
+    если user подписан на авторов с большим числом подписчиков,
+    их рецепты добавляются при чтении (fan-out-on-read).
+    '''
+    recipes = Recipe.objects.for_list(user)
+    large = list(CustomUser.objects.filter(
+        following__user=user, feed_on_read=True
+    ).values_list('pk', flat=True))
+    if not large:
+        # сортировка целиком по полям индекса, без досортировки по id
+        return recipes.filter(feed_entries__user=user).annotate(
+            feed_date=F('feed_entries__pub_date'),
+            feed_recipe=F('feed_entries__recipe'),
+        )
+    return recipes.filter(
+        Q(id__in=FeedEntry.objects.filter(user=user).values('recipe'))
+        | Q(author_id__in=large)
+    ).annotate(feed_date=F('pub_date'), feed_recipe=F('id'))
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# меняется при изменении формата представления рецепта
+FRAGMENT_VERSION = 4
+
+
+def body_key(recipe_id):
+    return f'recipe_body:{FRAGMENT_VERSION}:{recipe_id}'
+
+
+def get_bodies(recipes):
+    '''{id: представление} для найденных в кэше рецептов recipes.
+
+    Представление хранится вместе с именем картинки, из которой оно
+    построено, и не используется, если картинка рецепта в БД уже другая:
+    ее мог заменить image_worker, сброс кэша которого не дошел до
+    этого процесса.
+    '''
+    images = {recipe.id: recipe.image.name for recipe in recipes}
+    keys = {body_key(recipe_id): recipe_id for recipe_id in images}
+    bodies = {}
+    for key, (image, body) in cache.get_many(keys).items():
+        if image == images[keys[key]]:
+            bodies[keys[key]] = body
+    return bodies
+
+
+def set_bodies(bodies):
+    '''Сохраняет {id: (имя картинки, представление)}.'''
+
+    cache.set_many(
+        {body_key(recipe_id): entry for recipe_id, entry in bodies.items()},
+        settings.RECIPE_BODY_CACHE_TIMEOUT
+    )
+
+
+def invalidate(recipe_ids):
+    '''Удаляет представления рецептов из кэша сразу и повторно после
+    коммита, чтобы параллельный запрос не вернул в кэш старые данные.
+    '''
+    keys = [body_key(recipe_id) for recipe_id in recipe_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,106 @@
+import hashlib
+import re
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from PIL import Image, ImageOps
+
+# формат Pillow -> расширение файла
+FORMATS = {
+    'jpeg': 'jpg',
+    'webp': 'webp',
+}
+# основная картинка рецепта - самый широкий JPEG-вариант
+VARIANT_NAME = re.compile(r'^recipes/(?P<key>[0-9a-f]{20})/\d+\.jpg$')
+
+
+def to_rgb(image):
+    '''RGB-копия картинки, прозрачные области заливаются белым.'''
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def variant_name(key, width, format):
+    return f'recipes/{key}/{width}.{FORMATS[format]}'
+
+
+def variant_names(name):
+    '''Имена вариантов картинки {формат: {ширина: имя}}
+    или None, если картинка name еще не обработана.
+    '''
+    match = VARIANT_NAME.match(name or '')
+    if match is None:
+        return None
+    return {
+        format: {
+            width: variant_name(match['key'], width, format)
+            for width in sorted(settings.IMAGE_VARIANT_WIDTHS)
+        }
+        for format in FORMATS
+    }
+
+
+def content_key(content):
+    '''Ключ вариантов: хэш исходного файла и параметров обработки,
+    одинаковые картинки обрабатываются и хранятся один раз.
+    '''
+    signature = repr((
+        sorted(settings.IMAGE_VARIANT_WIDTHS),
+        settings.IMAGE_JPEG_QUALITY,
+        settings.IMAGE_WEBP_QUALITY,
+    )).encode('utf-8')
+    return hashlib.sha256(content + signature).hexdigest()[:20]
+
+
+def encode(image, format):
+    output = BytesIO()
+    # без параметра exif метаданные в файл не попадают
+    if format == 'jpeg':
+        image.save(
+            output, 'JPEG', quality=settings.IMAGE_JPEG_QUALITY,
+            optimize=True, progressive=True
+        )
+    else:
+        image.save(output, 'WEBP', quality=settings.IMAGE_WEBP_QUALITY)
+    return output.getvalue()
+
+
+def process_image(source):
+    '''Строит варианты картинки source (имя в хранилище) в JPEG и WebP
+    шириной не больше каждой из settings.IMAGE_VARIANT_WIDTHS:
+    поворот по EXIF, удаление метаданных, уменьшение.
+
+    Выполняется в процессах process_images и не обращается к БД.
+    Возвращает имя самого широкого JPEG-варианта.
+    '''
+    with default_storage.open(source) as file:
+        content = file.read()
+    key = content_key(content)
+    widths = sorted(settings.IMAGE_VARIANT_WIDTHS, reverse=True)
+    main = variant_name(key, widths[0], 'jpeg')
+    # последним сохраняется самый узкий JPEG: если он есть,
+    # картинка уже обработана
+    if default_storage.exists(variant_name(key, widths[-1], 'jpeg')):
+        return main
+
+    image = to_rgb(ImageOps.exif_transpose(Image.open(BytesIO(content))))
+    for width in widths:
+        # уменьшается предыдущий вариант, а не исходная картинка
+        if image.width > width:
+            image = image.resize(
+                (width, round(image.height * width / image.width)),
+                Image.LANCZOS
+            )
+        for format in ('webp', 'jpeg'):
+            name = variant_name(key, width, format)
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(encode(image, format)))
+    return main
@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import fragments
+from .images import process_image, variant_names
+from .models import ImageJob, Recipe
+
+
+def enqueue(recipes):
+    '''Ставит картинки рецептов recipes в очередь на обработку.'''
+
+    ImageJob.objects.bulk_create(
+        ImageJob(recipe_id=recipe.pk, source=recipe.image.name)
+        for recipe in recipes
+    )
+
+
+def enqueue_existing(all=False):
+    '''Ставит в очередь картинки рецептов без активных заданий:
+    только необработанные (загруженные до появления вариантов)
+    или, при all=True, все - например, после смены
+    settings.IMAGE_VARIANT_WIDTHS.
+    '''
+    active = ImageJob.objects.filter(
+        status__in=(ImageJob.PENDING, ImageJob.PROCESSING)
+    ).values('recipe_id')
+    recipes = [
+        recipe for recipe in Recipe.objects.exclude(
+            id__in=active
+        ).exclude(image='').only('id', 'image').iterator()
+        if all or variant_names(recipe.image.name) is None
+    ]
+    enqueue(recipes)
+    return len(recipes)
+
+
+def claim(limit):
+    '''Переводит до limit заданий из очереди в работу и возвращает их.'''
+
+    with transaction.atomic():
+        queryset = ImageJob.objects.filter(
+            status=ImageJob.PENDING
+        ).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        ids = list(queryset.values_list('id', flat=True)[:limit])
+        ImageJob.objects.filter(id__in=ids, status=ImageJob.PENDING).update(
+            status=ImageJob.PROCESSING,
+            attempts=F('attempts') + 1,
+            updated=timezone.now()
+        )
+    return list(ImageJob.objects.filter(
+        id__in=ids, status=ImageJob.PROCESSING
+    ).values_list('id', 'source'))
+
+
+def requeue_stale():
+    '''Возвращает в очередь задания, зависшие в работе дольше
+    settings.IMAGE_JOB_TIMEOUT (например, после падения обработчика).
+    '''
+    return ImageJob.objects.filter(
+        status=ImageJob.PROCESSING,
+        updated__lt=timezone.now() - timedelta(
+            seconds=settings.IMAGE_JOB_TIMEOUT
+        )
+    ).update(status=ImageJob.PENDING)
+
+
+def run(job):
+    '''Обработка одного задания (id, source) в процессе-обработчике.
+
+    Возвращает (id, имя обработанного файла, текст ошибки).
+    '''
+    id, source = job
+    try:
+        return id, process_image(source), ''
+    except Exception as error:
+        return id, None, f'{type(error).__name__}: {error}'
+
+
+def finish(id, result, error):
+    '''Сохраняет результат задания: при успехе картинка рецепта
+    заменяется обработанной, если ее не успели заменить другой.
+
+    Варианты картинки адресуются по содержимому и могут быть общими
+    для нескольких рецептов, поэтому не удаляются.
+    '''
+    job = ImageJob.objects.filter(id=id).first()
+    if job is None:
+        # рецепт удален во время обработки
+        return
+    if error:
+        job.error = error
+        job.status = (
+            ImageJob.FAILED
+            if job.attempts >= settings.IMAGE_JOB_MAX_ATTEMPTS
+            else ImageJob.PENDING
+        )
+        job.save(update_fields=['error', 'status', 'updated'])
+        return
+
+    with transaction.atomic():
+        switched = Recipe.objects.filter(
+            pk=job.recipe_id, image=job.source
+        ).update(image=result)
+        job.status = ImageJob.DONE
+        job.error = ''
+        job.save(update_fields=['error', 'status', 'updated'])
+    if switched:
+        # update() не отправляет сигналы
+        fragments.invalidate([job.recipe_id])
+    # после коммита закэшированные представления со старой картинкой
+    # не используются ни одним процессом: fragments.get_bodies сверяет
+    # их с картинкой рецепта в БД
+    if not Recipe.objects.filter(image=job.source).exists():
+        default_storage.delete(job.source)
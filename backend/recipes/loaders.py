@@ -0,0 +1,144 @@
+import csv
+import io
+import json
+import os
+
+from django.db import connection, transaction
+
+from .models import Ingredient
+from .versions import INGREDIENTS, bump_version
+
+FORMATS = ('csv', 'json', 'ndjson')
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension == 'jsonl':
+        return 'ndjson'
+    return extension if extension in FORMATS else 'csv'
+
+
+def read_ingredients(file, format):
+    '''Пары (name, measurement_unit) из файла в формате format.
+
+    csv и ndjson читаются построчно; json - массив объектов,
+    загружается целиком.
+    '''
+    if format == 'csv':
+        items = csv.reader(file)
+    elif format == 'ndjson':
+        items = (json.loads(line) for line in file if line.strip())
+    else:
+        items = json.load(file)
+    for item in items:
+        if not item:
+            continue
+        if isinstance(item, dict):
+            name, measurement_unit = item['name'], item['measurement_unit']
+        else:
+            name, measurement_unit = item
+        name, measurement_unit = name.strip(), measurement_unit.strip()
+        if name and measurement_unit:
+            yield name, measurement_unit
+
+
+class CsvStream(io.RawIOBase):
+    '''Файлоподобный объект для COPY: строки кодируются в CSV
+    по мере чтения, без промежуточного файла.
+    '''
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.text = io.StringIO()
+        self.writer = csv.writer(self.text)
+        self.buffer = bytearray()
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+            self.count += 1
+            self.buffer += self.text.getvalue().encode('utf-8')
+            self.text.seek(0)
+            self.text.truncate()
+        if size < 0:
+            size = len(self.buffer)
+        chunk = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return chunk
+
+
+def copy_ingredients(rows):
+    '''PostgreSQL: COPY во временную таблицу и
+    INSERT ... ON CONFLICT DO NOTHING по unique_ingredient.
+    '''
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    stream = CsvStream(rows)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE ingredient_staging '
+            '(name varchar(200), measurement_unit varchar(50)) '
+            'ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            'COPY ingredient_staging (name, measurement_unit) '
+            'FROM STDIN WITH (FORMAT csv)',
+            stream
+        )
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            'SELECT DISTINCT name, measurement_unit FROM ingredient_staging '
+            'ON CONFLICT DO NOTHING'
+        )
+        inserted = cursor.rowcount
+    return inserted, stream.count - inserted
+
+
+def bulk_create_ingredients(rows, batch_size):
+    '''Сверка с одним снимком существующих пар (name, measurement_unit)
+    и вставка новых пачками bulk_create.
+
+    Строки, добавленные параллельно после снимка, bulk_create пропускает
+    (ignore_conflicts), поэтому добавленные считаются по числу строк
+    таблицы до и после вставки.
+    '''
+    total = 0
+    batch = []
+    with transaction.atomic():
+        before = Ingredient.objects.count()
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        for row in rows:
+            total += 1
+            if row in existing:
+                continue
+            existing.add(row)
+            batch.append(Ingredient(name=row[0], measurement_unit=row[1]))
+            if len(batch) == batch_size:
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        inserted = Ingredient.objects.count() - before
+    return inserted, total - inserted
+
+
+def load_ingredients(rows, batch_size=1000):
+    '''Загружает ингредиенты, пропуская уже существующие.
+
+    Возвращает (число добавленных, число пропущенных).
+    '''
+    if connection.vendor == 'postgresql':
+        inserted, skipped = copy_ingredients(rows)
+    else:
+        inserted, skipped = bulk_create_ingredients(rows, batch_size)
+    # bulk_create и COPY не отправляют сигналы
+    if inserted:
+        bump_version(INGREDIENTS)
+    return inserted, skipped
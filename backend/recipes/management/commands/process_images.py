@@ -0,0 +1,89 @@
+import os
+import time
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from recipes import jobs
+
+# как часто долго работающий обработчик возвращает в очередь задания,
+# зависшие после падения процесса пула, секунды
+REQUEUE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Обработка загруженных картинок рецептов пулом процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов-обработчиков, 0 - обработка '
+                 'в текущем процессе'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Число заданий, забираемых из очереди за раз '
+                 '(по умолчанию 4 на обработчик)'
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=1.0,
+            help='Пауза между проверками пустой очереди, секунды'
+        )
+        parser.add_argument(
+            '--enqueue',
+            choices=('unprocessed', 'all'),
+            help='Поставить в очередь картинки существующих рецептов: '
+                 'необработанные или все'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Обработать очередь и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        batch_size = options['batch_size'] or max(workers, 1) * 4
+        if options['enqueue']:
+            enqueued = jobs.enqueue_existing(options['enqueue'] == 'all')
+            self.stdout.write(f'Поставлено в очередь: {enqueued}')
+        if workers:
+            # соединения с БД не должны наследоваться процессами пула
+            connections.close_all()
+            with Pool(workers) as pool:
+                done = self.process(pool.imap_unordered, batch_size, options)
+        else:
+            done = self.process(map, batch_size, options)
+        return f'Обработано картинок: {done}'
+
+    def requeue_stale(self):
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь заданий: {requeued}')
+
+    def process(self, map_jobs, batch_size, options):
+        done = 0
+        requeued_at = None
+        while True:
+            now = time.monotonic()
+            if requeued_at is None or now - requeued_at >= REQUEUE_INTERVAL:
+                self.requeue_stale()
+                requeued_at = now
+            claimed = jobs.claim(batch_size)
+            if not claimed:
+                if options['once']:
+                    return done
+                time.sleep(options['poll'])
+                continue
+            for id, result, error in map_jobs(jobs.run, claimed):
+                jobs.finish(id, result, error)
+                if error:
+                    self.stderr.write(f'Задание {id}: {error}')
+                else:
+                    done += 1
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчет счетчиков favorites_count и carts_count у рецептов, '
+            'recipes_count и followers_count у пользователей')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только вывести расхождения, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        drift = rebuild_counters(fix=not options['check'])
+        for field, rows in drift.items():
+            for pk, stored, actual in rows:
+                self.stdout.write(
+                    f'{field} id={pk}: сохранено {stored}, фактически {actual}'
+                )
+            self.stdout.write(f'{field}: расхождений {len(rows)}')
+        if options['check']:
+            return 'Проверка счетчиков завершена'
+        return 'Счетчики пересчитаны'
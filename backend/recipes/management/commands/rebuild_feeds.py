@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.feed import rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = 'Пересборка лент подписок по текущим подпискам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='id пользователя, можно указать несколько раз'
+        )
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_feeds(options['user_ids'])
+        return f'Пересобрано лент: {rebuilt}'
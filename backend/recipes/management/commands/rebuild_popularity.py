@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from recipes.popularity import rebuild_popularity
+
+
+class Command(BaseCommand):
+    help = 'Пересчет популярности рецептов по счетчикам избранного и корзин'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только вывести расхождения, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        drift = rebuild_popularity(fix=not options['check'])
+        for pk, stored, actual in drift:
+            self.stdout.write(
+                f'popularity id={pk}: сохранено {stored}, фактически {actual}'
+            )
+        self.stdout.write(f'Расхождений: {len(drift)}')
+        if options['check']:
+            return 'Проверка популярности завершена'
+        return 'Популярность пересчитана'
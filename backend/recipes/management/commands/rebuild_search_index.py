@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import index
+
+
+class Command(BaseCommand):
+    help = 'Пересборка поискового индекса рецептов'
+
+    def handle(self, *args, **options):
+        index()
+        return 'Поисковый индекс пересобран'
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.shopping import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = 'Сверка и пересборка сохраненных списков покупок по корзинам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только вывести расхождения, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        drift = rebuild_shopping_lists(fix=not options['check'])
+        for user_id, ingredient_id, stored, actual in drift:
+            self.stdout.write(
+                f'user_id={user_id} ingredient_id={ingredient_id}: '
+                f'сохранено {stored}, фактически {actual}'
+            )
+        self.stdout.write(f'Расхождений: {len(drift)}')
+        if options['check']:
+            return 'Проверка списков покупок завершена'
+        return 'Списки покупок пересобраны'
@@ -1,8 +1,12 @@
-import csv
+import os
+import time
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from recipes.models import Ingredient, Tag
+from recipes.loaders import (FORMATS, detect_format, load_ingredients,
+                             read_ingredients)
+from recipes.models import Tag
 
 TAGS = (
     ('Завтрак', 'breakfast', '#E26C2D'),
@@ -15,22 +19,44 @@ TAGS = (
 class Command(BaseCommand):
     help = 'Загрузка тестовых данных в БД'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Файл с ингредиентами (CSV, JSON или NDJSON)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла, по умолчанию - по расширению'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки bulk_create (кроме PostgreSQL)'
+        )
+
     def handle(self, *args, **options):
-        with open('data/ingredients.csv', encoding='utf-8') as cf:
-            ingredients = csv.reader(cf)
-            for item in ingredients:
-                name, measurement_unit = item
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit
-                )
-
-            # загрузка тегов
-            for tag in TAGS:
-                name, slug, color = tag
-                Tag.objects.get_or_create(
-                    name=name,
-                    color=color,
-                    slug=slug
-                )
-            return 'Данные успешно добавлены в таблицы Ingredient и Tag!'
+        path = options['path']
+        format = options['format'] or detect_format(path)
+
+        started = time.monotonic()
+        with open(path, encoding='utf-8') as cf:
+            inserted, skipped = load_ingredients(
+                read_ingredients(cf, format), options['batch_size']
+            )
+        self.stdout.write(
+            f'Ингредиенты: добавлено {inserted}, пропущено {skipped}, '
+            f'{time.monotonic() - started:.2f} с'
+        )
+
+        # загрузка тегов
+        for tag in TAGS:
+            name, slug, color = tag
+            Tag.objects.get_or_create(
+                name=name,
+                color=color,
+                slug=slug
+            )
+        return 'Данные успешно добавлены в таблицы Ingredient и Tag!'
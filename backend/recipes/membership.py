@@ -0,0 +1,103 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Favorited, ShoppingCart
+
+FAVORITES = 'favorites'
+CART = 'cart'
+
+MODELS = {
+    FAVORITES: Favorited,
+    CART: ShoppingCart,
+}
+
+
+def version_key(user_id, kind):
+    return f'membership:{kind}:{user_id}:version'
+
+
+def cache_key(user_id, kind, version):
+    return f'membership:{kind}:{user_id}:{version}'
+
+
+def get_versions(user_id):
+    '''{вид: версия} множеств пользователя. Множества хранятся под ключом
+    с версией, поэтому записанное по старой версии больше не читается.
+    '''
+    keys = {kind: version_key(user_id, kind) for kind in MODELS}
+    cached = cache.get_many(keys.values())
+    versions = {}
+    for kind, key in keys.items():
+        if key in cached:
+            versions[kind] = cached[key]
+        else:
+            # от текущего времени, чтобы после вытеснения ключа версия
+            # не совпала с прежней
+            versions[kind] = cache.get_or_set(key, time.time_ns(), None)
+    return versions
+
+
+def load(user_id, kind):
+    return frozenset(
+        MODELS[kind].objects.filter(
+            user_id=user_id
+        ).values_list('recipe_id', flat=True)
+    )
+
+
+def get_recipe_ids(user):
+    '''id рецептов в избранном и в списке покупок пользователя.
+
+    Версии и оба множества читаются из кэша двумя запросами get_many,
+    недостающие загружаются из БД и кладутся в кэш.
+    '''
+    if user is None or user.is_anonymous:
+        return {FAVORITES: frozenset(), CART: frozenset()}
+    versions = get_versions(user.id)
+    keys = {
+        kind: cache_key(user.id, kind, version)
+        for kind, version in versions.items()
+    }
+    cached = cache.get_many(keys.values())
+    result = {}
+    missing = {}
+    for kind, key in keys.items():
+        if key in cached:
+            result[kind] = cached[key]
+        else:
+            result[kind] = missing[key] = load(user.id, kind)
+    if missing:
+        cache.set_many(missing, settings.MEMBERSHIP_CACHE_TIMEOUT)
+    return result
+
+
+def for_request(request):
+    '''get_recipe_ids для пользователя запроса, один раз на запрос.'''
+
+    if request is None:
+        return get_recipe_ids(None)
+    if not hasattr(request, '_recipe_membership'):
+        request._recipe_membership = get_recipe_ids(request.user)
+    return request._recipe_membership
+
+
+def bump(user_id, kind):
+    key = version_key(user_id, kind)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def invalidate(user_id, kind):
+    '''Меняет версию множества kind пользователя сразу и повторно после
+    коммита: множество, загруженное параллельным запросом до коммита,
+    остается под старой версией и больше не читается.
+    '''
+    if user_id is None:
+        return
+    bump(user_id, kind)
+    transaction.on_commit(lambda: bump(user_id, kind))
@@ -0,0 +1,50 @@
+# Generated by Django 2.2.27 on 2026-10-18 17:58
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    '''Повторяющиеся ингредиенты заменяются в рецептах на ингредиент
+    с меньшим id, количество одинаковых ингредиентов в рецепте суммируется.
+    '''
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    groups = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        kept=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for group in groups:
+        duplicates = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=group['kept']).values_list('id', flat=True))
+        rows = RecipeIngredient.objects.filter(
+            ingredient_id__in=duplicates + [group['kept']]
+        ).order_by('recipe_id', 'id')
+        kept_rows = {}
+        for row in rows:
+            if row.recipe_id in kept_rows:
+                kept = kept_rows[row.recipe_id]
+                kept.amount += row.amount
+                kept.save(update_fields=['amount'])
+                row.delete()
+                continue
+            if row.ingredient_id != group['kept']:
+                row.ingredient_id = group['kept']
+                row.save(update_fields=['ingredient'])
+            kept_rows[row.recipe_id] = row
+        Ingredient.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
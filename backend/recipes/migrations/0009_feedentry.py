@@ -0,0 +1,99 @@
+# Generated by Django 2.2.27 on 2026-10-18 18:22
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def fill_feeds(apps, schema_editor):
+    '''Счетчики подписчиков и ленты по существующим подпискам:
+    последние FEED_BACKFILL_SIZE рецептов каждого автора.
+    '''
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Follow = apps.get_model('recipes', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+
+    CustomUser.objects.update(followers_count=Coalesce(
+        Subquery(
+            Follow.objects.filter(author=OuterRef('pk')).order_by().values(
+                'author'
+            ).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    ))
+    authors = CustomUser.objects.filter(
+        followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values('pk')
+    follows = Follow.objects.filter(
+        user__isnull=False, author__in=authors
+    ).values_list('user_id', 'author_id')
+    followers = defaultdict(list)
+    for user_id, author_id in follows.iterator():
+        followers[author_id].append(user_id)
+    # рецепты автора читаются один раз для всех его подписчиков
+    entries = []
+    for author_id, user_ids in followers.items():
+        recipes = list(Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE])
+        entries.extend(
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date
+            )
+            for user_id in user_ids
+            for recipe_id, pub_date in recipes
+        )
+        if len(entries) >= BATCH_SIZE:
+            FeedEntry.objects.bulk_create(entries)
+            entries = []
+    FeedEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_author_pub_date_idx'),
+        ('users', '0003_customuser_followers_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата создания рецепта')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', 'author'], name='feed_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 2.2.27 on 2026-10-18 18:30
+
+import math
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+import recipes.models
+
+
+def fill_popularity(apps, schema_editor):
+    '''Счетчики корзин и популярность уже сохраненных рецептов.'''
+
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    Recipe.objects.update(carts_count=Coalesce(
+        Subquery(
+            ShoppingCart.objects.filter(recipe=OuterRef('pk')).order_by(
+            ).values('recipe').annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    ))
+    batch = []
+    rows = Recipe.objects.values_list(
+        'pk', 'pub_date', 'favorites_count', 'carts_count'
+    ).order_by().iterator()
+    for pk, pub_date, favorites, carts in rows:
+        batch.append(Recipe(pk=pk, popularity=(
+            math.log2(1 + favorites + 2 * carts)
+            + recipes.models.age_score(pub_date)
+        )))
+        if len(batch) == 1000:
+            Recipe.objects.bulk_update(batch, ['popularity'])
+            batch = []
+    Recipe.objects.bulk_update(batch, ['popularity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число добавлений в список покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.FloatField(default=recipes.models.default_popularity, editable=False, help_text='log2(1 + вес добавлений) + возраст в периодах полураспада, см. recipes.popularity', verbose_name='Популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-id'], name='recipe_popularity_idx'),
+        ),
+        migrations.RunPython(fill_popularity, migrations.RunPython.noop),
+    ]
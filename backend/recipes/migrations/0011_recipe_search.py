@@ -0,0 +1,78 @@
+from django.db import migrations
+
+POSTGRESQL_CREATE = (
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    'CREATE INDEX recipe_search_idx ON recipes_recipe '
+    'USING GIN (search_vector)',
+    '''
+    UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector('russian', name), 'A')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM recipes_recipeingredient ri
+            JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+            WHERE ri.recipe_id = recipes_recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector('russian', text), 'C')
+    ''',
+)
+POSTGRESQL_DROP = (
+    'DROP INDEX recipe_search_idx',
+    'ALTER TABLE recipes_recipe DROP COLUMN search_vector',
+)
+
+SQLITE_CREATE = (
+    # префиксные индексы под запросы recipes.search.fts_query
+    '''
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, ingredients, text,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '3 4 5 6 7 8'
+    )
+    ''',
+    # веса названия, ингредиентов и описания в ранжировании
+    '''
+    INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rank)
+    VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')
+    ''',
+    '''
+    INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text)
+    SELECT id, name, coalesce((
+        SELECT group_concat(i.name, ' ')
+        FROM recipes_recipeingredient ri
+        JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+        WHERE ri.recipe_id = recipes_recipe.id
+    ), ''), text
+    FROM recipes_recipe
+    ''',
+)
+SQLITE_DROP = (
+    'DROP TABLE recipes_recipe_fts',
+)
+
+
+def run(statements):
+    '''Выполняет statements для текущей СУБД (postgresql или sqlite).'''
+
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, ()):
+            schema_editor.execute(sql, params=None)
+    return operation
+
+
+class Migration(migrations.Migration):
+    '''Поисковый индекс рецептов, см. recipes.search: tsvector с GIN-индексом
+    в PostgreSQL, FTS5-таблица в SQLite.
+    '''
+
+    dependencies = [
+        ('recipes', '0010_recipe_popularity'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRESQL_CREATE, 'sqlite': SQLITE_CREATE}),
+            run({'postgresql': POSTGRESQL_DROP, 'sqlite': SQLITE_DROP}),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.27 on 2026-10-18 19:28
+
+import time
+
+from django.db import migrations, models
+
+
+def create_versions(apps, schema_editor):
+    CatalogVersion = apps.get_model('recipes', 'CatalogVersion')
+    CatalogVersion.objects.bulk_create([
+        CatalogVersion(name='ingredients'),
+        CatalogVersion(name='tags'),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Справочник')),
+                ('version', models.BigIntegerField(default=time.time_ns, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия справочника',
+                'verbose_name_plural': 'Версии справочников',
+            },
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,34 @@
+import datetime as dt
+import time
+
+from django.conf import settings
 from django.db import models
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Value, Window)
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
 from colorfield.fields import ColorField
 
 from users.models import CustomUser
 
+# начало отсчета возраста рецептов в popularity
+POPULARITY_EPOCH = dt.datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+def age_score(moment):
+    '''Возрастная часть popularity: число периодов полураспада
+    settings.POPULARITY_HALF_LIFE_DAYS от POPULARITY_EPOCH до moment.
+    '''
+    half_life = dt.timedelta(days=settings.POPULARITY_HALF_LIFE_DAYS)
+    return (moment - POPULARITY_EPOCH) / half_life
+
+
+def default_popularity():
+    '''popularity нового рецепта без добавлений в избранное и корзины.'''
+
+    return age_score(timezone.now())
+
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -20,6 +45,13 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -48,6 +80,71 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        '''Флаг author_is_subscribed для пользователя user,
+        вычисляемый в одном запросе с рецептами.
+        '''
+        if user is None or user.is_anonymous:
+            return self.annotate(
+                author_is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+
+    def with_body(self):
+        '''Рецепты со всеми данными для общей части представления:
+        автор, теги и ингредиенты загружаются фиксированным числом запросов.
+        '''
+        return self.select_related('author').prefetch_related(
+            Prefetch(
+                'recipe_ingredient',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+            'tags',
+        )
+
+    def latest_by_authors(self, author_ids, limit=None):
+        '''Последние limit рецептов каждого из авторов author_ids
+        одним запросом: ROW_NUMBER() OVER (PARTITION BY author
+        ORDER BY pub_date DESC) по индексу recipe_author_pub_date_idx.
+        '''
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is None:
+            return queryset
+        ranked = Recipe.objects.filter(author_id__in=author_ids).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=[F('author')],
+                order_by=[F('pub_date').desc(), F('id').desc()]
+            )
+        ).order_by().values('id', 'position')
+        # Django 2.2 не умеет фильтровать по оконной функции, а RawSQL
+        # в __in получает лишние скобки и становится скалярным
+        # подзапросом, поэтому условие добавляется через extra()
+        sql, params = ranked.query.sql_with_params()
+        return queryset.extra(
+            where=[
+                f'"{self.model._meta.db_table}"."id" IN ('
+                f'SELECT ranked.id FROM ({sql}) ranked '
+                'WHERE ranked.position <= %s)'
+            ],
+            params=[*params, limit]
+        )
+
+    def for_list(self, user):
+        '''Только поля, нужные для пагинации и данных пользователя user,
+        остальное берется из кэша представлений (recipes.fragments).
+        '''
+        return self.only(
+            'id', 'pub_date', 'author', 'image', 'popularity'
+        ).with_user_flags(user)
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         CustomUser,
@@ -84,21 +181,54 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name="Дата создания рецепта",
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Число добавлений в избранное',
+        default=0,
+        editable=False,
+    )
+    carts_count = models.PositiveIntegerField(
+        verbose_name='Число добавлений в список покупок',
+        default=0,
+        editable=False,
+    )
+    popularity = models.FloatField(
+        verbose_name='Популярность',
+        help_text='log2(1 + вес добавлений) + возраст в периодах '
+                  'полураспада, см. recipes.popularity',
+        default=default_popularity,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-popularity', '-id'],
+                name='recipe_popularity_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
-    def favorited_count(self):
-        '''Для вывода в админке количества добавленных рецептов в избранное'''
-
-        return self.recipes_fav.count()
-
-    favorited_count.short_description = 'Число добавлений в избранное'
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # автор на момент загрузки, нужен для пересчета recipes_count
+        instance._loaded_author_id = instance.__dict__.get('author_id')
+        return instance
 
 
 class RecipeIngredient(models.Model):
@@ -199,6 +329,44 @@ class ShoppingCart(models.Model):
         return (f'{self.user}: {self.recipe}')
 
 
+class ShoppingListItem(models.Model):
+    '''Сумма ингредиента по рецептам списка покупок пользователя.
+
+    Обновляется сигналами ShoppingCart и при изменении рецептов,
+    пересчитывается командой rebuild_shopping_lists.
+    '''
+
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Покупатель'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Списки покупок'
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            ),
+        ]
+
+    def __str__(self):
+        return (f'{self.user}: {self.ingredient} {self.amount}')
+
+
 class Follow(models.Model):
     user = models.ForeignKey(
         CustomUser,
@@ -218,6 +386,9 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписчики'
         verbose_name_plural = 'Подписчики'
+        indexes = [
+            models.Index(fields=['user', '-id'], name='follow_user_id_idx'),
+        ]
 
         constraints = [
             models.UniqueConstraint(
@@ -228,3 +399,144 @@ class Follow(models.Model):
 
     def __str__(self):
         return (f'{self.user} подписан на: {self.author}')
+
+
+class FeedEntry(models.Model):
+    '''Рецепт в ленте подписчика (fan-out-on-write).
+
+    Записи создаются при публикации рецепта для всех подписчиков
+    автора, при подписке - для последних рецептов автора, удаляются
+    при отписке. Рецепты авторов с feed_on_read (подписчиков больше
+    settings.FEED_FANOUT_MAX_FOLLOWERS) в ленты не раскладываются
+    и добавляются при чтении (recipes.feed).
+    '''
+
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта'
+    )
+    # копия Recipe.pub_date: лента читается по индексу без сортировки
+    pub_date = models.DateTimeField(
+        verbose_name='Дата создания рецепта',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx'
+            ),
+        ]
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            ),
+        ]
+
+    def __str__(self):
+        return (f'{self.user}: {self.recipe}')
+
+
+class ImageJob(models.Model):
+    '''Задание на обработку загруженной картинки рецепта,
+    выполняется командой process_images.
+    '''
+
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Обрабатывается'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='image_jobs',
+        verbose_name='Рецепт'
+    )
+    source = models.CharField(
+        max_length=255,
+        verbose_name='Исходный файл'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Число попыток'
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Ошибка'
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Изменено'
+    )
+
+    class Meta:
+        verbose_name = 'Обработка картинки'
+        verbose_name_plural = 'Обработка картинок'
+        indexes = [
+            models.Index(fields=['status', 'id'], name='imagejob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.source} ({self.status})'
+
+
+class CatalogVersion(models.Model):
+    '''Версия справочника для ETag и индекса ингредиентов (recipes.versions).
+
+    Хранится в БД и меняется в транзакции изменения справочника, поэтому
+    одинакова для всех процессов независимо от кэша.
+    '''
+
+    name = models.CharField(
+        max_length=50,
+        primary_key=True,
+        verbose_name='Справочник'
+    )
+    # начальное значение от текущего времени, чтобы версия новой БД
+    # не совпала с ETag, запомненным клиентом раньше
+    version = models.BigIntegerField(
+        default=time.time_ns,
+        verbose_name='Версия'
+    )
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
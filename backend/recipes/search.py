@@ -0,0 +1,133 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+# Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+# PostgreSQL: столбец recipes_recipe.search_vector (tsvector, вне модели)
+# с GIN-индексом recipe_search_idx; SQLite: FTS5-таблица recipes_recipe_fts,
+# rowid - id рецепта. Оба создает миграция 0011_recipe_search.
+
+# порядок результатов поиска, по нему же строится курсор пагинации
+ORDERING = ('-search_rank', '-id')
+
+CONFIG = 'russian'
+# в FTS5 нет русского стемминга: слова ищутся по префиксу без окончания
+SUFFIX_LENGTH = 2
+MIN_PREFIX_LENGTH = 3
+# префиксы длиной MIN_PREFIX_LENGTH..MAX_PREFIX_LENGTH читаются из
+# префиксных индексов FTS5-таблицы, а не собираются по всем словам
+MAX_PREFIX_LENGTH = 8
+
+POSTGRESQL_INDEX = '''
+    UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector('russian', name), 'A')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM recipes_recipeingredient ri
+            JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+            WHERE ri.recipe_id = recipes_recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector('russian', text), 'C')
+'''
+
+SQLITE_INDEX = '''
+    INSERT OR REPLACE INTO recipes_recipe_fts (rowid, name, ingredients, text)
+    SELECT id, name, coalesce((
+        SELECT group_concat(i.name, ' ')
+        FROM recipes_recipeingredient ri
+        JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+        WHERE ri.recipe_id = recipes_recipe.id
+    ), ''), text
+    FROM recipes_recipe
+'''
+
+
+def id_condition(column, recipe_ids):
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    return f' WHERE {column} IN ({placeholders})', list(recipe_ids)
+
+
+def index(recipe_ids=None):
+    '''Обновляет поисковый индекс рецептов recipe_ids (None - всех)
+    одним запросом.
+    '''
+    sql = (
+        POSTGRESQL_INDEX if connection.vendor == 'postgresql'
+        else SQLITE_INDEX
+    )
+    params = []
+    if recipe_ids is not None:
+        recipe_ids = set(recipe_ids)
+        if not recipe_ids:
+            return
+        where, params = id_condition('recipes_recipe.id', recipe_ids)
+        sql += where
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def remove(recipe_ids):
+    '''Удаляет удаленные рецепты из FTS5-таблицы; в PostgreSQL
+    вектор удаляется вместе со строкой рецепта.
+    '''
+    if connection.vendor == 'postgresql' or not recipe_ids:
+        return
+    where, params = id_condition('rowid', recipe_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM recipes_recipe_fts{where}', params)
+
+
+def terms(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def fts_query(words):
+    '''Запрос FTS5: все слова; слова из букв ищутся как префикс
+    без окончания (не длиннее MAX_PREFIX_LENGTH), числа - целиком.
+    '''
+    return ' '.join(
+        '"{}"*'.format(word[:min(
+            MAX_PREFIX_LENGTH,
+            max(MIN_PREFIX_LENGTH, len(word) - SUFFIX_LENGTH)
+        )]) if word.isalpha() else f'"{word}"'
+        for word in words
+    )
+
+
+def search(queryset, text):
+    '''Рецепты queryset, содержащие все слова text, с релевантностью
+    search_rank (больше - выше); сортировка ORDERING.
+    '''
+    words = terms(text)
+    if not words:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        query = 'plainto_tsquery(%s::regconfig, %s)'
+        params = [CONFIG, ' '.join(words)]
+        queryset = queryset.extra(
+            where=[f'recipes_recipe.search_vector @@ {query}'],
+            params=params,
+        ).annotate(search_rank=RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, {query})',
+            params,
+            output_field=FloatField()
+        ))
+    else:
+        queryset = queryset.extra(
+            tables=['recipes_recipe_fts'],
+            where=[
+                'recipes_recipe_fts MATCH %s',
+                'recipes_recipe_fts.rowid = recipes_recipe.id',
+            ],
+            params=[fts_query(words)],
+        ).annotate(search_rank=RawSQL(
+            # rank - bm25 с весами названия, ингредиентов и описания
+            # из миграции; лучшие совпадения - с наименьшим rank.
+            # В отличие от bm25() столбец допустим и в GROUP BY
+            '-recipes_recipe_fts.rank',
+            (),
+            output_field=FloatField()
+        ))
+    return queryset.order_by(*ORDERING)
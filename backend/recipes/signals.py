@@ -0,0 +1,207 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import feed, fragments, membership, popularity, search, shopping
+from .models import (Favorited, Follow, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, Tag, TagRecipe)
+from .versions import INGREDIENTS, RECIPES, TAGS, bump_version
+from users.models import CustomUser
+
+
+def change_recipes_count(author_id, delta):
+    if author_id is not None:
+        CustomUser.objects.filter(pk=author_id).update(
+            recipes_count=F('recipes_count') + delta
+        )
+
+
+# поля рецепта, входящие в поисковый индекс
+SEARCH_FIELDS = frozenset(['name', 'text'])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, raw=False, update_fields=None,
+                 **kwargs):
+    if raw:
+        return
+    if created:
+        # новый рецепт индексирует создающий код после записи ингредиентов
+        # (RecipeWriteSerializer.create, RecipeAdmin.save_related, импорт)
+        bump_version(RECIPES)
+        change_recipes_count(instance.author_id, 1)
+        feed.publish([instance])
+    else:
+        if update_fields is None or SEARCH_FIELDS & update_fields:
+            search.index([instance.pk])
+        loaded_author_id = getattr(
+            instance, '_loaded_author_id', instance.author_id
+        )
+        if loaded_author_id != instance.author_id:
+            change_recipes_count(loaded_author_id, -1)
+            change_recipes_count(instance.author_id, 1)
+            feed.recipe_author_changed(instance)
+        fragments.invalidate([instance.pk])
+    instance._loaded_author_id = instance.author_id
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    # корзины удаляются каскадно вместе с рецептом
+    instance._cart_user_ids = shopping.cart_user_ids(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    bump_version(RECIPES)
+    change_recipes_count(instance.author_id, -1)
+    fragments.invalidate([instance.pk])
+    search.remove([instance.pk])
+    # при каскадном удалении ингредиенты рецепта могут быть удалены
+    # раньше корзин, поэтому списки пересобираются целиком
+    shopping.refresh(getattr(instance, '_cart_user_ids', ()))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=TagRecipe)
+@receiver(post_delete, sender=TagRecipe)
+def recipe_relation_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fragments.invalidate([instance.recipe_id])
+
+
+def recipe_ids_using(instance):
+    '''id рецептов, в представление которых входит тег или ингредиент.'''
+
+    if isinstance(instance, Tag):
+        queryset = TagRecipe.objects.filter(tag=instance)
+    else:
+        queryset = RecipeIngredient.objects.filter(ingredient=instance)
+    return list(queryset.values_list('recipe_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            fragments.invalidate([instance.pk])
+    elif action == 'pre_clear':
+        fragments.invalidate(recipe_ids_using(instance))
+    elif action.startswith('post_') and pk_set:
+        fragments.invalidate(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def catalog_item_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        recipe_ids = recipe_ids_using(instance)
+        fragments.invalidate(recipe_ids)
+        if sender is Ingredient:
+            search.index(recipe_ids)
+
+
+@receiver(post_save, sender=CustomUser)
+def author_saved(sender, instance, created, update_fields=None, **kwargs):
+    # вход пользователя обновляет только last_login
+    if created or update_fields == frozenset(['last_login']):
+        return
+    fragments.invalidate(
+        instance.recipes.values_list('id', flat=True)
+    )
+
+
+@receiver(pre_delete, sender=Favorited)
+@receiver(pre_delete, sender=ShoppingCart)
+@receiver(pre_delete, sender=Follow)
+def lock_deleted_row(sender, instance, **kwargs):
+    '''Блокирует удаляемую строку до конца транзакции удаления.
+
+    Параллельное удаление той же строки дожидается первого и не находит
+    ее: обработчики post_delete этого удаления не меняют счетчики второй
+    раз (DELETE удалил 0 строк, но сигнал отправляется все равно).
+    '''
+    rows = sender.objects.select_for_update().filter(pk=instance.pk)
+    instance._already_deleted = not rows.exists()
+
+
+def already_deleted(instance):
+    return getattr(instance, '_already_deleted', False)
+
+
+@receiver(post_save, sender=Favorited)
+def favorited_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        popularity.change(instance.recipe_id, favorites=1)
+        membership.invalidate(instance.user_id, membership.FAVORITES)
+
+
+@receiver(post_delete, sender=Favorited)
+def favorited_deleted(sender, instance, **kwargs):
+    if already_deleted(instance):
+        return
+    popularity.change(instance.recipe_id, favorites=-1)
+    membership.invalidate(instance.user_id, membership.FAVORITES)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        popularity.change(instance.recipe_id, carts=1)
+        membership.invalidate(instance.user_id, membership.CART)
+        if instance.user_id and instance.recipe_id:
+            shopping.apply_recipe(instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    if already_deleted(instance):
+        return
+    popularity.change(instance.recipe_id, carts=-1)
+    membership.invalidate(instance.user_id, membership.CART)
+    if instance.user_id and instance.recipe_id:
+        shopping.apply_recipe(instance.user_id, instance.recipe_id, -1)
+
+
+def change_followers_count(author_id, delta):
+    if author_id is not None:
+        CustomUser.objects.filter(pk=author_id).update(
+            followers_count=Greatest(F('followers_count') + delta, 0)
+        )
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_followers_count(instance.author_id, 1)
+        if instance.author_id:
+            feed.followers_changed(instance.author_id, 1)
+        if instance.user_id and instance.author_id:
+            feed.backfill(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    if already_deleted(instance):
+        return
+    change_followers_count(instance.author_id, -1)
+    if instance.user_id and instance.author_id:
+        feed.trim(instance.user_id, instance.author_id)
+    if instance.author_id:
+        feed.followers_changed(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    bump_version(INGREDIENTS)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_version(TAGS)
@@ -0,0 +1,71 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import CatalogVersion
+
+RECIPES = 'recipes'
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+
+# версии справочников хранятся в БД (CatalogVersion): по ним строятся
+# ETag, которые nginx и браузеры перепроверяют бессрочно. Версия
+# рецептов меняется при каждом создании и удалении рецепта и только
+# ограничивает время жизни кэша счетчиков, поэтому хранится в кэше.
+CATALOGS = frozenset([INGREDIENTS, TAGS])
+
+# прочитанные из БД версии справочников: {name: (версия, время чтения)}
+local_versions = {}
+
+
+def get_version(name):
+    '''Текущая версия набора данных name.
+
+    Начальное значение берется от текущего времени, чтобы после очистки
+    кэша или БД версия не совпала с запомненной ранее.
+    '''
+    if name in CATALOGS:
+        return get_catalog_version(name)
+    return cache.get_or_set(f'version:{name}', time.time_ns(), None)
+
+
+def get_catalog_version(name):
+    '''Версия справочника из БД. В процессе запоминается на
+    settings.CATALOG_VERSION_TTL секунд, чтобы проверка ETag и индекса
+    ингредиентов обходилась без запросов; изменения из других процессов
+    видны не позже чем через это время.
+    '''
+    now = time.monotonic()
+    local = local_versions.get(name)
+    if local is not None and now - local[1] < settings.CATALOG_VERSION_TTL:
+        return local[0]
+    version, _ = CatalogVersion.objects.get_or_create(name=name)
+    local_versions[name] = (version.version, now)
+    return version.version
+
+
+def bump_version(name):
+    '''Увеличивает версию набора данных name,
+    инвалидируя все ключи кэша, построенные на ее основе.
+    Версия справочника меняется в текущей транзакции.
+    '''
+    if name in CATALOGS:
+        updated = CatalogVersion.objects.filter(name=name).update(
+            version=F('version') + 1
+        )
+        if not updated:
+            CatalogVersion.objects.get_or_create(name=name)
+        # до коммита другой поток может запомнить прежнюю версию
+        local_versions.pop(name, None)
+        transaction.on_commit(lambda: local_versions.pop(name, None))
+        return None
+    key = f'version:{name}'
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, None)
+        return version
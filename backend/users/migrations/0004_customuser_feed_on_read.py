@@ -0,0 +1,27 @@
+# Generated by Django 2.2.27 on 2026-10-18 21:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_feed_on_read(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    CustomUser.objects.filter(
+        followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).update(feed_on_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_customuser_followers_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='feed_on_read',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Лента при чтении'),
+        ),
+        migrations.RunPython(set_feed_on_read, migrations.RunPython.noop),
+    ]
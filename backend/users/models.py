@@ -45,6 +45,23 @@ class CustomUser(AbstractUser):
         verbose_name='Пользователь активен',
         default=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Число рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0,
+        editable=False,
+    )
+    # рецепты автора добавляются в ленты при чтении, а не при публикации
+    # (recipes.feed.followers_changed)
+    feed_on_read = models.BooleanField(
+        verbose_name='Лента при чтении',
+        default=False,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = "Пользователь"